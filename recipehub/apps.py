@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+class RecipehubConfig(AppConfig):
+    name = 'recipehub'
+
+    def ready(self):
+        from .querystats import install_query_counter
+        connection_created.connect(install_query_counter, dispatch_uid='recipehub.install_query_counter')
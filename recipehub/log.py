@@ -0,0 +1,105 @@
+"""
+Logging helpers: JSON lines, a queue handler that writes from a background
+thread, the sampling filter of the access log and the filter stamping records
+with the request ID. Wired in settings.LOGGING.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+from contextvars import ContextVar
+
+# Attributes every LogRecord has, anything else was passed with ``extra=``
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+# ID of the request being served, set by recipehub.middleware.CustomMiddleware
+request_id_var = ContextVar('request_id', default='-')
+
+
+class JsonFormatter(logging.Formatter):
+    """
+        One JSON object per record: time, level, logger, message and the ``extra`` fields.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class BackgroundFileHandler(logging.handlers.QueueHandler):
+    """
+        Formats records on the calling thread and appends them to ``filename``
+        from a QueueListener thread, so a request never waits on file I/O.
+
+        The queue holds at most ``queue_size`` records. When the writer falls
+        that far behind, records are dropped (and counted in ``dropped``)
+        rather than blocking the caller.
+    """
+
+    def __init__(self, filename, queue_size=10000, max_bytes=0, backup_count=0):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        target = logging.handlers.RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count,
+                                                      encoding='utf-8', delay=True)
+        # Records reach the target already formatted by this handler
+        target.setFormatter(logging.Formatter('%(message)s'))
+        self.dropped = 0
+        self.listener = logging.handlers.QueueListener(self.queue, target)
+        self.listener.start()
+        atexit.register(self.stop_listener)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop_listener(self):
+        # Writes out what is still queued, safe to call more than once
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def close(self):
+        self.stop_listener()
+        for target in self.listener.handlers:
+            target.close()
+        super().close()
+
+
+class SampleFilter(logging.Filter):
+    """
+        Lets through a ``rate`` fraction (0-1) of the records, plus every
+        record of a failed (status >= 400) or slow (``slow_ms``) request.
+    """
+
+    def __init__(self, rate=1.0, slow_ms=None):
+        super().__init__()
+        self.rate = float(rate)
+        self.slow_ms = slow_ms
+
+    def filter(self, record):
+        if getattr(record, 'status', 0) >= 400:
+            return True
+        if self.slow_ms is not None and getattr(record, 'duration_ms', 0) >= self.slow_ms:
+            return True
+        return self.rate >= 1 or random.random() < self.rate
+
+
+class RequestIdFilter(logging.Filter):
+    """
+        Sets ``request_id`` on every record, ``-`` outside of a request. Runs
+        on the logging thread, before the record is queued.
+    """
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
@@ -0,0 +1,178 @@
+"""
+In-process request metrics, served at /metrics in the Prometheus text format,
+to the clients allowed by METRICS_ALLOWED_IPS or METRICS_TOKEN.
+
+Every metric is guarded by its own lock, so the threads of a worker can record
+concurrently. Each worker process keeps (and serves) its own numbers: scrape
+every worker, or run a single one per scrape target.
+"""
+import hmac
+import ipaddress
+import math
+import threading
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+UNMATCHED_URL_NAME = 'unmatched'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines += [line for key, value in items for line in self._render_value(key, value)]
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_value(self, key, value):
+        yield f"{self.name}{format_labels(zip(self.label_names, key))} {format_value(value)}"
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, (None, 0))
+            if counts is None:
+                counts = [0] * len(self.buckets)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def _render_value(self, key, value):
+        counts, total = value
+        labels = list(zip(self.label_names, key))
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            yield f"{self.name}_bucket{format_labels(labels + [('le', format_value(bound))])} {cumulative}"
+        yield f"{self.name}_sum{format_labels(labels)} {format_value(total)}"
+        yield f"{self.name}_count{format_labels(labels)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        return '\n'.join(line for metric in self._metrics for line in metric.render()) + '\n'
+
+    def reset(self):
+        for metric in self._metrics:
+            metric.reset()
+
+
+registry = Registry()
+
+REQUESTS = registry.register(Counter(
+    'recipehub_http_requests_total', "Requests answered, by URL name, method and status.",
+    ('url_name', 'method', 'status'),
+))
+REQUEST_LATENCY = registry.register(Histogram(
+    'recipehub_http_request_duration_seconds', "Time spent answering a request.",
+    ('url_name', 'method'), LATENCY_BUCKETS,
+))
+DB_QUERIES = registry.register(Histogram(
+    'recipehub_db_queries_per_request', "Database queries run by a request.",
+    ('url_name',), QUERY_COUNT_BUCKETS,
+))
+DB_TIME = registry.register(Histogram(
+    'recipehub_db_duration_seconds_per_request', "Time a request spent waiting on the database.",
+    ('url_name',), LATENCY_BUCKETS,
+))
+RESPONSE_SIZE = registry.register(Histogram(
+    'recipehub_http_response_size_bytes', "Size of a response body, streamed responses excluded.",
+    ('url_name',), SIZE_BUCKETS,
+))
+
+
+def get_url_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return UNMATCHED_URL_NAME
+    return match.view_name or match.url_name or UNMATCHED_URL_NAME
+
+
+def observe_request(request, response, duration, queries, query_duration):
+    url_name = get_url_name(request)
+    REQUESTS.inc(url_name=url_name, method=request.method, status=response.status_code)
+    REQUEST_LATENCY.observe(duration, url_name=url_name, method=request.method)
+    DB_QUERIES.observe(queries, url_name=url_name)
+    DB_TIME.observe(query_duration, url_name=url_name)
+    if not response.streaming:
+        RESPONSE_SIZE.observe(len(response.content), url_name=url_name)
+
+
+def metrics_allowed(request):
+    token = settings.METRICS_TOKEN
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if token and hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode()):
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(allowed, strict=False) for allowed in settings.METRICS_ALLOWED_IPS)
+
+
+def metrics_view(request):
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,46 +1,118 @@
 import logging
 import copy
+import re
+import time
+import uuid
+from contextlib import nullcontext
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
 from django.http import JsonResponse
 from recipes.constant import RESPONSE_FAILED
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from .log import request_id_var
+from .metrics import get_url_name, observe_request
+from .profiling import PROFILE_HEADER, PhaseTimer, start_profile
+from .querystats import QueryCounter
+from recipes.authentication import CachedJWTAuthentication
 from django.contrib.auth.models import AnonymousUser
 from rest_framework_simplejwt.exceptions import InvalidToken
 from django.utils.deprecation import MiddlewareMixin
 
 
 logger = logging.getLogger(__name__)
+access_logger = logging.getLogger('recipehub.access')
+
+# A client supplied X-Request-ID is kept when it looks like an ID
+REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+
+
+def get_request_id(request):
+    request_id = request.META.get('HTTP_X_REQUEST_ID', '')
+    return request_id if REQUEST_ID_RE.match(request_id) else uuid.uuid4().hex
+
 
 class CustomMiddleware(MiddlewareMixin):
     def __init__(self, get_response):
-        self.get_response = get_response
+        # Works out whether get_response is async, see __call__
+        super().__init__(get_response)
         # One-time configuration and initialization.
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
         # Code to be executed for each request before
         # the view (and later middleware) are called.
         # self.is_authenticated(request)
         
         # if request.META.get("HTTP_AUTHORIZATION"):
-        #     jwt_authenticator = JWTAuthentication()
+        #     jwt_authenticator = CachedJWTAuthentication()
         #     header = jwt_authenticator.get_header(request)
         #     raw_token = jwt_authenticator.get_raw_token(header)
         #     validated_token = jwt_authenticator.get_validated_token(raw_token)
         #     request.user = jwt_authenticator.get_user(validated_token)
-        
-        
-        logger.info(f"Request: {request.method} {request.get_full_path()}")
-        
-        response = self.get_response(request)
-
-        # Code to be executed for each request/response after
-        # the view is called.
-        
-        # Log the response status code
-        logger.info(f"Response: {response.status_code}")
 
+        request.request_id = get_request_id(request)
+        token = request_id_var.set(request.request_id)
+        try:
+            timer = PhaseTimer()
+            profile = start_profile(request, timer)
+            counter = QueryCounter(request)
+            started = time.perf_counter()
+            with counter, timer, profile or nullcontext():
+                response = self.get_response(request)
+            self.record(request, response, started, counter, timer, profile)
+        finally:
+            request_id_var.reset(token)
+        return response
 
+    async def __acall__(self, request):
+        # Same as __call__ for ASGI, where the async views are awaited directly
+        # A profile here also sees the other tasks run by the event loop meanwhile
+        request.request_id = get_request_id(request)
+        token = request_id_var.set(request.request_id)
+        try:
+            timer = PhaseTimer()
+            if PROFILE_HEADER in request.META:
+                # Checking the staff token may hit the database
+                profile = await sync_to_async(start_profile)(request, timer)
+            else:
+                profile = start_profile(request, timer)
+            counter = QueryCounter(request)
+            started = time.perf_counter()
+            with counter, timer, profile or nullcontext():
+                response = await self.get_response(request)
+            self.record(request, response, started, counter, timer, profile)
+        finally:
+            request_id_var.reset(token)
         return response
 
+    def record(self, request, response, started, counter, timer, profile=None):
+        """
+            Set the X-Request-ID and Server-Timing headers, feed the /metrics
+            histograms and write one structured access log line, by a
+            background thread (see recipehub.log). A profiled request is also
+            saved to the profile ring (see recipehub.profiling).
+        """
+        duration = time.perf_counter() - started
+        response['X-Request-ID'] = request.request_id
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = timer.server_timing(duration)
+        observe_request(request, response, duration, counter.count, counter.duration)
+        if profile is not None:
+            try:
+                profile.save(request, response, get_url_name(request), counter.count)
+            except OSError:
+                logger.exception("Could not save the profile of %s %s", request.method, request.path)
+        if not access_logger.isEnabledFor(logging.INFO):
+            return
+        access_logger.info("request", extra={
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 2),
+            'queries': counter.count,
+            'db_ms': round(counter.duration * 1000, 2),
+        })
+
     def process_exception(self, request, exception):
         logger.critical(f"An error occurred: {exception}", exc_info=True)
         
@@ -53,7 +125,7 @@ class CustomMiddleware(MiddlewareMixin):
     def is_authenticated(self, request):
         
         if request.META.get("HTTP_AUTHORIZATION"):
-            jwt_authenticator = JWTAuthentication()
+            jwt_authenticator = CachedJWTAuthentication()
             header = jwt_authenticator.get_header(request)
             if header is not None:
                 raw_token = jwt_authenticator.get_raw_token(header)
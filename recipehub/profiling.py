@@ -0,0 +1,236 @@
+"""
+Per-request phase timing, and on-demand profiling of single requests.
+
+While SERVER_TIMING is on, the time of every request is split into phases
+(auth, validation, db, serialize, render) by hooks installed on DRF and the
+database execute wrapper, and reported in its Server-Timing header.
+
+A request is also profiled when it carries ``X-Profile: 1`` along with the JWT
+of a staff user, or when it is picked at random at PROFILE_SAMPLE_RATE. It then
+runs under cProfile.
+
+The last PROFILE_RING_SIZE profiles are kept in PROFILE_DIR, as a pstats dump
+and a JSON summary each, and are listed and downloaded at /admin/profiles/.
+"""
+import cProfile
+import functools
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from django.conf import settings
+from rest_framework.exceptions import AuthenticationFailed
+
+logger = logging.getLogger('recipehub.profiling')
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_NAME_RE = re.compile(r'^\d+-\d+$')
+SERVER_TIMING_PHASES = ('auth', 'validation', 'db', 'serialize', 'render')
+
+_current_timer = ContextVar('recipehub_phase_timer', default=None)
+# cProfile attaches to the thread, and every ASGI request shares the event
+# loop thread: one profile at a time per process keeps them apart
+_profile_lock = threading.Lock()
+
+
+class PhaseTimer:
+    """
+        Exclusive time per phase: while a phase runs inside another (SQL run
+        by a serializer), the time counts for the inner phase only.
+
+        Phases are counted while the timer is entered, as a context manager.
+    """
+
+    def __init__(self):
+        self.totals = {}
+        self._stack = []
+
+    def enter(self, name):
+        now = time.perf_counter()
+        if self._stack:
+            outer, started = self._stack[-1]
+            self.totals[outer] = self.totals.get(outer, 0.0) + now - started
+        self._stack.append([name, now])
+
+    def exit(self):
+        now = time.perf_counter()
+        name, started = self._stack.pop()
+        self.totals[name] = self.totals.get(name, 0.0) + now - started
+        if self._stack:
+            self._stack[-1][1] = now
+
+    def __enter__(self):
+        self._token = _current_timer.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _current_timer.reset(self._token)
+
+    def server_timing(self, duration):
+        """
+            The Server-Timing header value, in milliseconds.
+        """
+        metrics = [f"{name};dur={self.totals[name] * 1000:.2f}" for name in SERVER_TIMING_PHASES if name in self.totals]
+        metrics.append(f"total;dur={duration * 1000:.2f}")
+        return ', '.join(metrics)
+
+
+class phase:
+    """
+        Counts the time of the block for ``name`` when the request is timed,
+        does nothing otherwise.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.timer = _current_timer.get()
+        if self.timer is not None:
+            self.timer.enter(self.name)
+
+    def __exit__(self, *exc_info):
+        if self.timer is not None:
+            self.timer.exit()
+
+
+def timed(name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with phase(name):
+            return func(*args, **kwargs)
+    wrapper.phase = name
+    return wrapper
+
+
+def install_phase_hooks():
+    """
+        Wrap the DRF methods each phase is measured around. Called once, from
+        RecipesConfig.ready(), only when SERVER_TIMING is on: the wrappers
+        apply to every DRF view and serializer of the process.
+    """
+    from rest_framework.response import Response
+    from rest_framework.serializers import BaseSerializer, ListSerializer, Serializer
+    from rest_framework.views import APIView
+
+    if hasattr(APIView.initial, 'phase'):
+        return
+    # Authentication, permissions and throttling
+    APIView.initial = timed('auth', APIView.initial)
+    BaseSerializer.is_valid = timed('validation', BaseSerializer.is_valid)
+    ListSerializer.is_valid = timed('validation', ListSerializer.is_valid)
+    Serializer.data = property(timed('serialize', Serializer.data.fget))
+    ListSerializer.data = property(timed('serialize', ListSerializer.data.fget))
+    Response.rendered_content = property(timed('render', Response.rendered_content.fget))
+
+
+def is_staff_token(request):
+    from recipes.authentication import CachedJWTAuthentication
+
+    try:
+        result = CachedJWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return False
+    return result is not None and result[0].is_staff
+
+
+def start_profile(request, timer):
+    """
+        A RequestProfile to run the request under, or None when it is not
+        profiled. Its phases are read from ``timer``.
+    """
+    if request.META.get(PROFILE_HEADER) == '1' and is_staff_token(request):
+        reason = 'header'
+    elif settings.PROFILE_SAMPLE_RATE > 0 and random.random() < settings.PROFILE_SAMPLE_RATE:
+        reason = 'sample'
+    else:
+        return None
+    if not _profile_lock.acquire(blocking=False):
+        logger.info("Not profiling %s %s, another profile is running", request.method, request.path)
+        return None
+    return RequestProfile(reason, timer)
+
+
+class RequestProfile:
+    def __init__(self, reason, timer):
+        self.reason = reason
+        self.timer = timer
+        self.profiler = cProfile.Profile()
+        self.duration = None
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.disable()
+        self.duration = time.perf_counter() - self._started
+        _profile_lock.release()
+
+    def phases_ms(self):
+        phases = {name: round(total * 1000, 2) for name, total in self.timer.totals.items()}
+        phases['other'] = round(self.duration * 1000 - sum(phases.values()), 2)
+        return phases
+
+    def save(self, request, response, url_name, queries):
+        """
+            Write the profile to the ring, dropping the oldest ones beyond
+            PROFILE_RING_SIZE.
+        """
+        directory = Path(settings.PROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        # Names sort by time, the pid keeps the workers from clashing
+        name = f"{time.time_ns()}-{os.getpid()}"
+        summary = {
+            'name': name,
+            'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'reason': self.reason,
+            'request_id': getattr(request, 'request_id', None),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'url_name': url_name,
+            'status': response.status_code,
+            'duration_ms': round(self.duration * 1000, 2),
+            'queries': queries,
+            'phases_ms': self.phases_ms(),
+        }
+        self.profiler.dump_stats(directory / f"{name}.prof")
+        (directory / f"{name}.json").write_text(json.dumps(summary))
+        for stale in sorted(directory.glob('*.prof'))[:-settings.PROFILE_RING_SIZE]:
+            stale.unlink(missing_ok=True)
+            stale.with_suffix('.json').unlink(missing_ok=True)
+        logger.info("Profiled %s %s in %sms: %s", request.method, summary['path'],
+                    summary['duration_ms'], summary['phases_ms'])
+        return summary
+
+
+def list_profiles():
+    """
+        Summaries of the profiles in the ring, newest first.
+    """
+    directory = Path(settings.PROFILE_DIR)
+    profiles = []
+    for path in sorted(directory.glob('*.json'), reverse=True):
+        try:
+            profiles.append(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            # Pruned by another worker, or being written
+            continue
+    return profiles
+
+
+def profile_path(name):
+    """
+        Path of the pstats dump called ``name``, or None when there is none.
+    """
+    if not PROFILE_NAME_RE.match(name):
+        return None
+    path = Path(settings.PROFILE_DIR) / f"{name}.prof"
+    return path if path.exists() else None
@@ -0,0 +1,156 @@
+"""
+Per-request query counting, per-fingerprint SQL statistics and the slow-query log.
+
+A fingerprint is a statement with its literals and placeholders replaced by
+``?`` and its lists of them collapsed, so every query of one shape, whatever
+the user input, is counted under the same key.
+"""
+import logging
+import re
+import threading
+import time
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connection
+from .metrics import get_url_name
+from .profiling import phase
+
+logger = logging.getLogger('recipehub.slow_query')
+
+STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+PLACEHOLDER_RE = re.compile(r"%s|\?")
+PLACEHOLDER_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+ROW_LIST_RE = re.compile(r"\(\?\+\)(?:\s*,\s*\(\?\+\))+")
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    sql = STRING_LITERAL_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    sql = PLACEHOLDER_RE.sub('?', sql)
+    sql = WHITESPACE_RE.sub(' ', sql).strip()
+    # IN (?, ?, ?) -> IN (?+), VALUES (?+), (?+) -> VALUES (?+)+
+    sql = PLACEHOLDER_LIST_RE.sub('(?+)', sql)
+    return ROW_LIST_RE.sub('(?+)+', sql)
+
+
+class QueryStats:
+    """
+        Count, total and max time of every fingerprint run by this process.
+
+        At most ``QUERY_STATS_MAX_FINGERPRINTS`` fingerprints are tracked, the
+        time of statements of any other shape is added to ``overflow``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.overflow = 0
+
+    def record(self, sql, params, duration, view):
+        key = fingerprint(sql)
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is None:
+                if len(self._stats) >= getattr(settings, 'QUERY_STATS_MAX_FINGERPRINTS', 1000):
+                    self.overflow += 1
+                    return
+                entry = self._stats[key] = {
+                    'fingerprint': key, 'count': 0, 'total': 0.0, 'max': 0.0, 'views': set(),
+                }
+            entry['count'] += 1
+            entry['total'] += duration
+            if duration >= entry['max']:
+                # The slowest run is the one worth explaining
+                entry['max'] = duration
+                entry['sql'] = sql
+                entry['params'] = params
+            entry['views'].add(view)
+
+        if duration * 1000 >= getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 100):
+            logger.warning("Slow query %.1fms in %s: %s", duration * 1000, view, key)
+
+    def top(self, limit=20, order_by='total'):
+        with self._lock:
+            entries = [dict(entry, views=sorted(entry['views'])) for entry in self._stats.values()]
+        entries.sort(key=lambda entry: entry[order_by], reverse=True)
+        for entry in entries[:limit]:
+            entry['mean'] = entry['total'] / entry['count']
+        return entries[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.overflow = 0
+
+
+query_stats = QueryStats()
+
+
+_query_counter = ContextVar('recipehub_query_counter', default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+    """
+        Execute wrapper installed on every database connection (see
+        install_query_counter()). Queries are counted by the QueryCounter of the
+        request being served, which the context variable carries into the
+        sync_to_async threads running the ORM calls of async views.
+    """
+    counter = _query_counter.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    return counter(execute, sql, params, many, context)
+
+
+class QueryCounter:
+    """
+        Counts the queries of a request and the time spent in them while
+        entered, as a context manager. Each statement is also added to the
+        per-fingerprint stats.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.count = 0
+        self.duration = 0.0
+
+    def __enter__(self):
+        self._token = _query_counter.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _query_counter.reset(self._token)
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        started = time.perf_counter()
+        try:
+            with phase('db'):
+                return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.duration += elapsed
+            query_stats.record(sql, None if many else params, elapsed, get_url_name(self.request))
+
+
+def install_query_counter(sender, connection, **kwargs):
+    # Installed once per connection rather than around each request: async
+    # views run their queries on sync_to_async threads, each with its own
+    # connection, and concurrent requests would pop each other's wrapper.
+    # Connected to connection_created by RecipehubConfig.ready().
+    connection.execute_wrappers.append(count_queries)
+
+
+def explain(sql, params):
+    """
+        The query plan of a SELECT, or None for any other statement.
+    """
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return None
+    prefix = 'EXPLAIN QUERY PLAN' if connection.vendor == 'sqlite' else 'EXPLAIN'
+    with connection.cursor() as cursor:
+        cursor.execute(f"{prefix} {sql}", params)
+        # SQLite's detail is the last column, other backends return one text column
+        return "\n".join(str(row[-1]) for row in cursor.fetchall())
@@ -47,10 +47,13 @@ INSTALLED_APPS = [
     'rest_framework',
     'drf_yasg',
     'rest_framework_simplejwt',
-    'corsheaders'
+    'corsheaders',
+    'recipehub',
 ]
 
 CORS_ALLOW_ALL_ORIGINS = True
+# Readable by browser clients, to match their timings with the server's
+CORS_EXPOSE_HEADERS = ['X-Request-ID', 'Server-Timing']
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
@@ -68,7 +71,7 @@ MIDDLEWARE = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'recipes.authentication.CachedJWTAuthentication',
     ),
     'EXCEPTION_HANDLER': 'recipes.utils.custom_exception_handler',
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
@@ -111,6 +114,10 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Seconds a connection is kept for the next requests of its thread,
+        # 0 closes it after every request (use 0 under ASGI)
+        'CONN_MAX_AGE': int(os.environ.get("DB_CONN_MAX_AGE", 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
@@ -157,6 +164,95 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static/')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Seconds a paginated list's COUNT(*) / the facet counts of a filter set are
+# reused at most. Both are also invalidated whenever a Recipe or Review is
+# written. Use a shared cache backend when running several workers.
+RECIPE_COUNT_CACHE_TIMEOUT = int(os.environ.get("RECIPE_COUNT_CACHE_TIMEOUT", 60))
+RECIPE_FACET_CACHE_TIMEOUT = int(os.environ.get("RECIPE_FACET_CACHE_TIMEOUT", 300))
+
+# Rows fetched per round trip when streaming a recipe export
+RECIPE_EXPORT_CHUNK_SIZE = int(os.environ.get("RECIPE_EXPORT_CHUNK_SIZE", 1000))
+
+# Typo tolerant search: trigram index candidates scored per query, and the
+# minimum trigram similarity (0-1) of a result
+RECIPE_FUZZY_CANDIDATES = int(os.environ.get("RECIPE_FUZZY_CANDIDATES", 200))
+RECIPE_FUZZY_MIN_SIMILARITY = float(os.environ.get("RECIPE_FUZZY_MIN_SIMILARITY", 0.3))
+
+# Number of distinct /recipes filter shapes whose compiled SQL is memoized
+RECIPE_FILTER_CACHE_SIZE = int(os.environ.get("RECIPE_FILTER_CACHE_SIZE", 256))
+
+# ModelBackend with the password hashing run on recipes.hashing's pool
+AUTHENTICATION_BACKENDS = ['recipes.hashing.HashingPoolBackend']
+
+# Threads hashing / verifying passwords for login and signup (default: the
+# number of CPUs, at most 4), and jobs that may wait for one before a login
+# is answered with 503
+PASSWORD_HASHING_WORKERS = int(os.environ.get("PASSWORD_HASHING_WORKERS", 0)) or None
+PASSWORD_HASHING_MAX_PENDING = int(os.environ.get("PASSWORD_HASHING_MAX_PENDING", 64))
+
+# Users inserted per transaction by the bulk_create_users command
+USER_BULK_CREATE_BATCH_SIZE = int(os.environ.get("USER_BULK_CREATE_BATCH_SIZE", 1000))
+
+# Users kept by CachedJWTAuthentication, and seconds a cached user is served
+JWT_USER_CACHE_SIZE = int(os.environ.get("JWT_USER_CACHE_SIZE", 10000))
+JWT_USER_CACHE_TTL = int(os.environ.get("JWT_USER_CACHE_TTL", 60))
+
+# Rows validated and inserted per transaction by a recipe import
+RECIPE_IMPORT_CHUNK_SIZE = int(os.environ.get("RECIPE_IMPORT_CHUNK_SIZE", 1000))
+
+# Most reviews accepted by one POST /reviews/batch, and rows per INSERT
+REVIEW_BATCH_MAX_SIZE = int(os.environ.get("REVIEW_BATCH_MAX_SIZE", 5000))
+REVIEW_BATCH_INSERT_SIZE = int(os.environ.get("REVIEW_BATCH_INSERT_SIZE", 500))
+
+# Rendered recipe detail responses are kept in their own cache alias:
+# "locmem" (per process, least recently used entries are evicted) or "file"
+# (shared by the workers of one host, stored under RECIPE_DETAIL_CACHE_LOCATION).
+RECIPE_DETAIL_CACHE_ALIAS = 'recipe-detail'
+RECIPE_DETAIL_CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+}
+RECIPE_DETAIL_CACHE_BACKEND = os.environ.get("RECIPE_DETAIL_CACHE_BACKEND", 'locmem')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    RECIPE_DETAIL_CACHE_ALIAS: {
+        'BACKEND': RECIPE_DETAIL_CACHE_BACKENDS[RECIPE_DETAIL_CACHE_BACKEND],
+        'LOCATION': os.environ.get("RECIPE_DETAIL_CACHE_LOCATION", str(BASE_DIR / 'cache' / 'recipe-detail')),
+        'TIMEOUT': int(os.environ.get("RECIPE_DETAIL_CACHE_TIMEOUT", 3600)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get("RECIPE_DETAIL_CACHE_MAX_ENTRIES", 5000)),
+        },
+    },
+}
+
+# PRAGMAs run on every new SQLite connection, see recipes.signals. "default"
+# is SQLite's own behaviour; "tuned" lets readers go on while a review is
+# written (WAL), syncs at checkpoints only, reads through mmap and waits for
+# locks instead of failing with "database is locked".
+SQLITE_PRAGMA_PROFILES = {
+    'default': {
+        'journal_mode': 'DELETE',
+    },
+    'tuned': {
+        'busy_timeout': int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+        # Negative sizes are in KiB
+        'cache_size': int(os.environ.get("SQLITE_CACHE_SIZE", -64000)),
+        'temp_store': 'MEMORY',
+    },
+}
+SQLITE_PRAGMA_PROFILE = os.environ.get("SQLITE_PRAGMA_PROFILE", 'tuned')
+SQLITE_PRAGMAS = SQLITE_PRAGMA_PROFILES[SQLITE_PRAGMA_PROFILE]
+
+# Seconds after which a worker reloads its autocomplete index in the
+# background, to pick up the recipes and reviews written by other workers
+AUTOCOMPLETE_INDEX_TTL = int(os.environ.get("AUTOCOMPLETE_INDEX_TTL", 300))
+
 # Path to the logs directory
 LOGS_DIR = BASE_DIR / 'logs'
 
@@ -164,32 +260,105 @@ LOGS_DIR = BASE_DIR / 'logs'
 if not LOGS_DIR.exists():
     LOGS_DIR.mkdir()
 
+# Who may read /metrics, which shows per-route traffic, latencies and error
+# counts: clients whose address is in METRICS_ALLOWED_IPS (comma separated
+# addresses or networks, e.g. "10.0.0.0/8") or that send
+# "Authorization: Bearer <METRICS_TOKEN>". Everyone else gets a 403, so with
+# both left empty the endpoint is closed. Behind a reverse proxy every client
+# has the proxy's address: use the token, or allow the scraper's network only
+# where it reaches the workers directly.
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get("METRICS_ALLOWED_IPS", "").split(",") if ip.strip()]
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# Statements slower than this are logged by recipehub.slow_query, and the
+# number of distinct SQL fingerprints whose timings are kept per process
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get("SLOW_QUERY_THRESHOLD_MS", 100))
+QUERY_STATS_MAX_FINGERPRINTS = int(os.environ.get("QUERY_STATS_MAX_FINGERPRINTS", 1000))
+
+# Fraction (0-1) of the requests run under cProfile (staff can also ask for
+# one with an X-Profile: 1 header), where the profiles are written and how
+# many of the latest are kept there, see recipehub.profiling
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", str(BASE_DIR / 'profiles'))
+PROFILE_RING_SIZE = int(os.environ.get("PROFILE_RING_SIZE", 50))
+
+# Whether responses carry a Server-Timing header with the time spent per
+# phase (auth, validation, db, serialize, render), see recipehub.profiling.
+# Off, DRF is left unpatched and profiles only split the time they spend in SQL.
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "1") == "1"
+
+# Levels of the django logger (DEBUG also logs every SQL statement while
+# DEBUG is on) and of the access log, and the fraction (0-1) of successful,
+# fast requests written to the access log. Failed requests and requests slower
+# than ACCESS_LOG_SLOW_MS are always written.
+DJANGO_LOG_LEVEL = os.environ.get("DJANGO_LOG_LEVEL", "INFO")
+ACCESS_LOG_LEVEL = os.environ.get("ACCESS_LOG_LEVEL", "INFO")
+ACCESS_LOG_SAMPLE_RATE = float(os.environ.get("ACCESS_LOG_SAMPLE_RATE", 1.0))
+ACCESS_LOG_SLOW_MS = float(os.environ.get("ACCESS_LOG_SLOW_MS", 1000))
+# Records waiting for the background writer before new ones are dropped
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+
+# Both files are written by a background thread, see recipehub.log
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
     "formatters": {
         "verbose": {
-            "format": "{levelname} {asctime} {module} {process:d} {thread:d} {message}",
+            "format": "{levelname} {asctime} {module} {process:d} {thread:d} {request_id} {message}",
             "style": "{",
         },
         "simple": {
             "format": "{levelname} {message}",
             "style": "{",
         },
+        "json": {
+            "()": "recipehub.log.JsonFormatter",
+        },
+    },
+    "filters": {
+        "request_id": {
+            "()": "recipehub.log.RequestIdFilter",
+        },
+        "access_sample": {
+            "()": "recipehub.log.SampleFilter",
+            "rate": ACCESS_LOG_SAMPLE_RATE,
+            "slow_ms": ACCESS_LOG_SLOW_MS,
+        },
     },
     "handlers": {
         "file": {
             "level": "DEBUG",
-            "class": "logging.FileHandler",
-            "filename": "logs/debug.log",
+            "class": "recipehub.log.BackgroundFileHandler",
+            "filename": LOGS_DIR / "debug.log",
+            "queue_size": LOG_QUEUE_SIZE,
+            "formatter": "verbose",
+            "filters": ["request_id"],
+        },
+        "access": {
+            "level": "DEBUG",
+            "class": "recipehub.log.BackgroundFileHandler",
+            "filename": LOGS_DIR / "access.log",
+            "queue_size": LOG_QUEUE_SIZE,
+            "formatter": "json",
+            "filters": ["access_sample", "request_id"],
         },
     },
     "loggers": {
         "django": {
             "handlers": ["file"],
-            "level": "DEBUG",
+            "level": DJANGO_LOG_LEVEL,
             "propagate": True,
         },
+        "recipehub": {
+            "handlers": ["file"],
+            "level": "INFO",
+            "propagate": False,
+        },
+        "recipehub.access": {
+            "handlers": ["access"],
+            "level": ACCESS_LOG_LEVEL,
+            "propagate": False,
+        },
     },
 }
 
@@ -20,6 +20,8 @@ from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from recipes.views import home
+from recipes.admin import profile_download_view, profile_list_view, query_stats_view
+from .metrics import metrics_view
 from django.conf.urls.static import static
 from django.conf import settings
 
@@ -41,6 +43,10 @@ urlpatterns = [
     path('swagger<format>/', schema_view.without_ui(cache_timeout=0), name='schema-json'),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    path('admin/query-stats/', admin.site.admin_view(query_stats_view), name='query-stats'),
+    path('admin/profiles/', admin.site.admin_view(profile_list_view), name='profiles'),
+    path('admin/profiles/<str:name>.prof', admin.site.admin_view(profile_download_view), name='profile-download'),
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('api/', include('recipes.urls')),
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
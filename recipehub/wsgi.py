@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'recipehub.settings')
 
 application = get_wsgi_application()
+
+# Build the autocomplete index in the background, before the first request needs it
+from recipes.autocomplete import prefix_index  # noqa: E402
+prefix_index.warm()
@@ -1,4 +1,10 @@
 from django.contrib import admin
+from django.db import DatabaseError
+from django.http import FileResponse, HttpResponseNotFound
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from recipehub.profiling import list_profiles, profile_path
+from recipehub.querystats import explain, query_stats
 from .models import (
     User,
     Recipe,
@@ -22,10 +28,11 @@ admin.site.register(User, UserAdmin)
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('title', 'user_id', 'category', 'cooking_time', 'serving_size', 'created_at', 'updated_at')
+    list_display = ('title', 'user_id', 'category', 'cooking_time', 'serving_size', 'avg_rating', 'review_count', 'created_at', 'updated_at')
     list_filter = ('title', 'user_id', 'category', 'cooking_time', 'serving_size')
     ordering = ('-created_at',)
     search_fields = ('title', 'user', 'category', 'cooking_time', 'serving_size')
+    readonly_fields = ('rating_sum', 'review_count', 'avg_rating')
     prepopulated_fields = {'title': ('title',)}
 
 admin.site.register(Recipe, RecipeAdmin)
@@ -48,4 +55,65 @@ class ReviewAdmin(admin.ModelAdmin):
     search_fields = ('user', 'recipe', 'rating', 'comment')
 
 
-admin.site.register(Review, ReviewAdmin)
\ No newline at end of file
+admin.site.register(Review, ReviewAdmin)
+
+
+QUERY_STATS_ORDERS = ('total', 'max', 'count')
+
+
+def query_stats_view(request):
+    """
+        The top SQL fingerprints of this worker, with their query plans on request.
+    """
+    if request.method == 'POST':
+        query_stats.reset()
+        return redirect(request.path)
+
+    order_by = request.GET.get('order', 'total')
+    if order_by not in QUERY_STATS_ORDERS:
+        order_by = 'total'
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 200)
+    except ValueError:
+        limit = 20
+    with_plan = request.GET.get('explain') == '1'
+
+    entries = query_stats.top(limit, order_by)
+    for entry in entries:
+        entry.update(total_ms=entry['total'] * 1000, mean_ms=entry['mean'] * 1000, max_ms=entry['max'] * 1000)
+        if with_plan:
+            try:
+                entry['plan'] = explain(entry['sql'], entry['params'])
+            except DatabaseError as exc:
+                entry['plan'] = f"EXPLAIN failed: {exc}"
+
+    context = {
+        **admin.site.each_context(request),
+        'title': 'SQL fingerprints',
+        'entries': entries,
+        'overflow': query_stats.overflow,
+        'orders': QUERY_STATS_ORDERS,
+        'order_by': order_by,
+        'limit': limit,
+        'with_plan': with_plan,
+    }
+    return TemplateResponse(request, 'admin/query_stats.html', context)
+
+
+def profile_list_view(request):
+    """
+        The request profiles kept in the ring, newest first.
+    """
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Request profiles',
+        'profiles': list_profiles(),
+    }
+    return TemplateResponse(request, 'admin/profiles.html', context)
+
+
+def profile_download_view(request, name):
+    path = profile_path(name)
+    if path is None:
+        return HttpResponseNotFound("No such profile, it may have been pruned.")
+    return FileResponse(path.open('rb'), as_attachment=True, filename=path.name)
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from django.conf import settings
+        from recipehub.profiling import install_phase_hooks
+        if settings.SERVER_TIMING:
+            install_phase_hooks()
@@ -0,0 +1,93 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+class UserCache:
+    """
+        Bounded, time limited, in-process cache of users by id.
+
+        The least recently used user is evicted past ``maxsize`` entries and an
+        entry is never served once it is ``ttl`` seconds old. Entries are
+        dropped by the User save/delete signals of this process, the TTL bounds
+        how long another worker can serve a user changed elsewhere.
+    """
+
+    def __init__(self, maxsize=None, ttl=None):
+        self._lock = threading.Lock()
+        self._users = OrderedDict()   # user_id -> (expires_at, user)
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+    def get_maxsize(self):
+        return self.maxsize if self.maxsize is not None else getattr(settings, 'JWT_USER_CACHE_SIZE', 10000)
+
+    def get_ttl(self):
+        return self.ttl if self.ttl is not None else getattr(settings, 'JWT_USER_CACHE_TTL', 60)
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if expires_at <= time.monotonic():
+                del self._users[user_id]
+                return None
+            self._users.move_to_end(user_id)
+        # Requests must not share one instance
+        return copy.copy(user)
+
+    def set(self, user_id, user):
+        with self._lock:
+            self._users[user_id] = (time.monotonic() + self.get_ttl(), copy.copy(user))
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.get_maxsize():
+                self._users.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+user_cache = UserCache()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+        JWTAuthentication that serves the token's user from ``user_cache``
+        instead of selecting it on every request.
+
+        A cached user goes through the same active / revoked token checks as
+        one read from the database.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = user_cache.get(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user)
+            return user
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
@@ -0,0 +1,306 @@
+import heapq
+import os
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from django.conf import settings
+from django.db import connection
+
+INGREDIENT_WORD_RE = re.compile(r"[^\W\d_]{3,}", re.UNICODE)
+# Separates a term from its kind in the sorted key list, sorts before any character
+KEY_SEPARATOR = "\x00"
+# Prefixes covering more keys than this keep their TOP_SIZE best keys, their
+# ranges are too large to rank on every keystroke
+TOP_MIN_RANGE = 200
+TOP_SIZE = 50
+RECIPE_COLUMNS = "id, title, category_id, ingredients, review_count"
+
+
+def recipe_terms(title, category_id, ingredients):
+    """
+        The (term, kind) pairs a recipe can be completed by.
+    """
+    terms = {(title, 'title')}
+    if category_id:
+        terms.add((category_id, 'category'))
+    for word in INGREDIENT_WORD_RE.findall(ingredients or ''):
+        terms.add((word.lower(), 'ingredient'))
+    return terms
+
+
+class PrefixIndex:
+    """
+        In-process prefix index over recipe titles, categories and ingredient words.
+
+        Terms are kept lowercased in a sorted list, so the completions of a
+        prefix are a contiguous range found by binary search. A term's score
+        is the popularity (review count + 1) of the recipes carrying it, kept
+        up to date as recipes and reviews change, so ranking a range costs one
+        lookup per term. Prefixes covering many terms also keep their best
+        terms.
+
+        The index is built from tabRecipe in a background thread when the
+        worker starts (see warm()) and then kept up to date by the Recipe and
+        Review signals of this process. Writes handled by other workers are
+        picked up by a background rebuild, every AUTOCOMPLETE_INDEX_TTL seconds.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = threading.Condition(self._lock)
+        self.loaded = False
+        self.loaded_at = None
+        # Recipes changed while a build runs, None when none is running
+        self._changed = None
+        self._reset()
+
+    def _reset(self):
+        self._keys = []
+        self._terms = {}          # key -> (display term, kind, {recipe_id, ...})
+        self._scores = {}         # key -> sum of the popularity of its recipes
+        self._recipe_keys = {}    # recipe_id -> {key, ...}
+        self._popularity = {}     # recipe_id -> review_count + 1
+        self._top = {}            # prefix of a large range -> its best keys, best first
+
+    @staticmethod
+    def _key(term, kind):
+        return f"{term.lower()}{KEY_SEPARATOR}{kind}"
+
+    def _after_fork(self):
+        # A build started before the fork (gunicorn --preload) has no thread
+        # in the child, start it again there
+        self._lock = threading.RLock()
+        self._built = threading.Condition(self._lock)
+        if self._changed is not None:
+            self._changed = None
+            self.warm()
+
+    def warm(self):
+        """
+            Start building the index in a background thread, called when a
+            worker starts so no request waits for the build.
+        """
+        with self._lock:
+            if self.loaded or self._changed is not None:
+                return
+            self._changed = set()
+        self._start_build()
+
+    def load(self):
+        """
+            Build the index in the calling thread, or wait for the build
+            already running.
+        """
+        with self._lock:
+            while not self.loaded and self._changed is not None:
+                self._built.wait()
+            if self.loaded:
+                return
+            self._changed = set()
+        self._build()
+
+    def _reload_if_stale(self):
+        with self._lock:
+            if self._changed is not None or time.monotonic() - self.loaded_at < settings.AUTOCOMPLETE_INDEX_TTL:
+                return
+            self._changed = set()
+        self._start_build()
+
+    def _start_build(self):
+        def run():
+            try:
+                self._build()
+            finally:
+                # The connection Django opened for this thread
+                connection.close()
+
+        threading.Thread(target=run, name='prefix-index-build', daemon=True).start()
+
+    def _build(self):
+        """
+            Build a fresh copy aside and swap it in, completions keep using the
+            current one meanwhile. The recipes changed during the build are
+            read again into the copy before the swap, the build must have been
+            claimed by setting ``_changed`` under the lock.
+        """
+        try:
+            fresh = PrefixIndex()
+            fresh._fill()
+            while True:
+                with self._lock:
+                    changed, self._changed = self._changed, set()
+                    if not changed:
+                        self._keys, self._terms, self._scores = fresh._keys, fresh._terms, fresh._scores
+                        self._recipe_keys, self._popularity, self._top = fresh._recipe_keys, fresh._popularity, fresh._top
+                        self.loaded = True
+                        self.loaded_at = time.monotonic()
+                        break
+                fresh._refresh(changed)
+        finally:
+            with self._lock:
+                self._changed = None
+                self._built.notify_all()
+
+    def _fill(self):
+        terms, scores = self._terms, self._scores
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT {RECIPE_COLUMNS} FROM tabRecipe")
+            while True:
+                rows = cursor.fetchmany(1000)
+                if not rows:
+                    break
+                # _add() without the top lists (there are none yet) and with
+                # the keys sorted once at the end
+                for recipe_id, title, category_id, ingredients, review_count in rows:
+                    popularity = self._popularity[recipe_id] = review_count + 1
+                    keys = self._recipe_keys[recipe_id] = set()
+                    for term, kind in recipe_terms(title, category_id, ingredients):
+                        key = f"{term.lower()}{KEY_SEPARATOR}{kind}"
+                        entry = terms.get(key)
+                        if entry is None:
+                            entry = terms[key] = (term, kind, set())
+                        entry[2].add(recipe_id)
+                        keys.add(key)
+                        scores[key] = scores.get(key, 0) + popularity
+        self._keys = sorted(terms)
+        # The first keystrokes after a build would otherwise rank the largest ranges
+        for prefix in {key[:length] for key in self._keys for length in (1, 2)}:
+            if KEY_SEPARATOR not in prefix:
+                self._best_keys(prefix, TOP_SIZE)
+
+    def _refresh(self, recipe_ids):
+        """
+            Bring ``recipe_ids`` up to date from tabRecipe, removing the ones
+            that are gone.
+        """
+        recipe_ids = list(recipe_ids)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT {RECIPE_COLUMNS} FROM tabRecipe WHERE id IN ({', '.join(['%s'] * len(recipe_ids))})",
+                recipe_ids,
+            )
+            rows = {row[0]: row for row in cursor.fetchall()}
+        for recipe_id in recipe_ids:
+            if recipe_id in self._recipe_keys:
+                self._remove(recipe_id)
+            if recipe_id in rows:
+                _, title, category_id, ingredients, review_count = rows[recipe_id]
+                self._add(recipe_id, recipe_terms(title, category_id, ingredients), review_count)
+
+    def _add(self, recipe_id, terms, review_count):
+        popularity = self._popularity[recipe_id] = review_count + 1
+        keys = self._recipe_keys.setdefault(recipe_id, set())
+        for term, kind in terms:
+            key = self._key(term, kind)
+            entry = self._terms.get(key)
+            if entry is None:
+                entry = self._terms[key] = (term, kind, set())
+                insort(self._keys, key)
+            entry[2].add(recipe_id)
+            keys.add(key)
+            self._change_score(key, popularity)
+
+    def _remove(self, recipe_id):
+        popularity = self._popularity.pop(recipe_id, 1)
+        for key in self._recipe_keys.pop(recipe_id, ()):
+            recipes = self._terms[key][2]
+            recipes.discard(recipe_id)
+            if recipes:
+                self._change_score(key, -popularity)
+            else:
+                del self._terms[key]
+                del self._keys[bisect_left(self._keys, key)]
+                del self._scores[key]
+                self._change_score(key, None)
+        return popularity - 1
+
+    def _rank(self, key):
+        # Best first, ties in key order
+        return -self._scores[key], key
+
+    def _change_score(self, key, delta):
+        """
+            Add ``delta`` to the score of ``key``, None when the key is gone,
+            and keep the best keys of its prefixes in order.
+        """
+        if delta is not None:
+            self._scores[key] = self._scores.get(key, 0) + delta
+        if not self._top:
+            return
+        for length in range(1, key.index(KEY_SEPARATOR) + 1):
+            top = self._top.get(key[:length])
+            if top is None:
+                continue
+            # A full list holds every key of the range, a partial one may miss
+            # the key that would replace one going down or away
+            complete = len(top) < TOP_SIZE
+            if key in top:
+                if delta is None:
+                    if not complete:
+                        del self._top[key[:length]]
+                        continue
+                    top.remove(key)
+                elif delta < 0 and not complete:
+                    del self._top[key[:length]]
+                    continue
+                top.sort(key=self._rank)
+            elif delta is not None and (complete or self._rank(key) < self._rank(top[-1])):
+                top.append(key)
+                top.sort(key=self._rank)
+                del top[TOP_SIZE:]
+
+    def _best_keys(self, prefix, limit):
+        top = self._top.get(prefix)
+        if top is not None and limit <= TOP_SIZE:
+            return top[:limit]
+        start = bisect_left(self._keys, prefix)
+        end = bisect_left(self._keys, prefix + "\U0010ffff", lo=start)
+        if end - start <= TOP_MIN_RANGE or limit > TOP_SIZE:
+            return heapq.nsmallest(limit, map(self._keys.__getitem__, range(start, end)), key=self._rank)
+        top = self._top[prefix] = heapq.nsmallest(TOP_SIZE, map(self._keys.__getitem__, range(start, end)), key=self._rank)
+        return top[:limit]
+
+    def update_recipe(self, recipe):
+        with self._lock:
+            if self._changed is not None:
+                self._changed.add(recipe.id)
+            if not self.loaded:
+                return
+            review_count = self._remove(recipe.id) if recipe.id in self._recipe_keys else recipe.review_count
+            self._add(recipe.id, recipe_terms(recipe.title, recipe.category_id, recipe.ingredients), review_count)
+
+    def remove_recipe(self, recipe_id):
+        with self._lock:
+            if self._changed is not None:
+                self._changed.add(recipe_id)
+            if self.loaded:
+                self._remove(recipe_id)
+
+    def add_reviews(self, recipe_id, count):
+        with self._lock:
+            if self._changed is not None:
+                self._changed.add(recipe_id)
+            if recipe_id in self._popularity:
+                previous = self._popularity[recipe_id]
+                self._popularity[recipe_id] = max(previous + count, 1)
+                delta = self._popularity[recipe_id] - previous
+                if delta:
+                    for key in self._recipe_keys[recipe_id]:
+                        self._change_score(key, delta)
+
+    def complete(self, prefix, limit=10):
+        """
+            The ``limit`` most popular completions of ``prefix``.
+        """
+        self.load()
+        self._reload_if_stale()
+        with self._lock:
+            return [
+                {'term': self._terms[key][0], 'kind': self._terms[key][1], 'score': self._scores[key]}
+                for key in self._best_keys(prefix.lower(), limit)
+            ]
+
+
+prefix_index = PrefixIndex()
+os.register_at_fork(after_in_child=prefix_index._after_fork)
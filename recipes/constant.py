@@ -13,6 +13,12 @@ RESPONSE_FAILED = {
     "data": {}
 }
 
+# Message for a new user that reuses the value of one of these unique fields
+USER_CONFLICT_MESSAGES = {
+    "email": "User already exists",
+    "phone_number": "Phone number already used",
+}
+
 
 class CustomPagination(PageNumberPagination):
     page_size = 10
@@ -0,0 +1,96 @@
+import hashlib
+import threading
+from django.conf import settings
+from django.core.cache import caches
+
+
+def detail_cache():
+    return caches[getattr(settings, 'RECIPE_DETAIL_CACHE_ALIAS', 'default')]
+
+
+class DetailCacheStats:
+    """
+        Hit / miss counters of the recipe detail cache in this process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def record(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            }
+
+    def reset(self):
+        with self._lock:
+            self.hits = self.misses = self.invalidations = 0
+
+
+detail_cache_stats = DetailCacheStats()
+
+
+def _version_key(recipe_id):
+    return f"recipe-detail-version:{recipe_id}"
+
+
+def detail_cache_key(recipe_id, etag, variant):
+    """
+        Key of one rendered variant of a recipe's detail response.
+
+        The recipe's version counter is part of the key, so bumping it drops
+        every variant (projection, review page, media type) of that recipe at
+        once. The ETag is part of it too, so an entry can never be served for
+        another state of the recipe than the one it was rendered from.
+    """
+    version = detail_cache().get_or_set(_version_key(recipe_id), 0, timeout=None)
+    digest = hashlib.md5(f"{etag}|{variant}".encode()).hexdigest()
+    return f"recipe-detail:{recipe_id}:{version}:{digest}"
+
+
+def get_cached_detail(key):
+    """
+        The cached (content, content_type) of a detail response, or None.
+    """
+    cached = detail_cache().get(key)
+    detail_cache_stats.record('hits' if cached is not None else 'misses')
+    return cached
+
+
+def set_cached_detail(key, content, content_type):
+    detail_cache().set(key, (content, content_type))
+
+
+def invalidate_recipe_detail(*recipe_ids):
+    cache = detail_cache()
+    for recipe_id in {recipe_id for recipe_id in recipe_ids if recipe_id is not None}:
+        try:
+            cache.incr(_version_key(recipe_id))
+        except ValueError:
+            # Nothing was ever cached for the recipe
+            continue
+        detail_cache_stats.record('invalidations')
+
+
+def detail_cache_info():
+    """
+        Counters and configuration of the recipe detail cache, to size it.
+    """
+    config = settings.CACHES.get(getattr(settings, 'RECIPE_DETAIL_CACHE_ALIAS', 'default'), {})
+    return {
+        **detail_cache_stats.snapshot(),
+        'backend': config.get('BACKEND'),
+        'timeout': config.get('TIMEOUT'),
+        'max_entries': config.get('OPTIONS', {}).get('MAX_ENTRIES'),
+    }
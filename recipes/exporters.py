@@ -0,0 +1,89 @@
+import csv
+import io
+import json
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+
+# tabRecipe columns written by an export, rating aggregates included
+EXPORT_COLUMNS = (
+    'id', 'title', 'category_id', 'user_id', 'description', 'ingredients', 'preparation_steps',
+    'cooking_time', 'serving_size', 'rating_sum', 'review_count', 'avg_rating', 'created_at', 'updated_at',
+)
+
+EXPORT_CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def get_chunk_size(chunk_size=None):
+    return chunk_size or getattr(settings, 'RECIPE_EXPORT_CHUNK_SIZE', 1000)
+
+
+def iter_recipe_chunks(chunk_size=None):
+    """
+        Yield every recipe as lists of dicts of at most ``chunk_size`` rows.
+
+        The rows are pulled from a single cursor with ``fetchmany()``, so only
+        one chunk is ever held in memory whatever the size of tabRecipe.
+    """
+    chunk_size = get_chunk_size(chunk_size)
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {', '.join(EXPORT_COLUMNS)} FROM tabRecipe ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield [dict(zip(EXPORT_COLUMNS, row)) for row in rows]
+
+
+def iter_ndjson(chunk_size=None):
+    for chunk in iter_recipe_chunks(chunk_size):
+        yield "".join(json.dumps(row, cls=DjangoJSONEncoder) + "\n" for row in chunk)
+
+
+def iter_csv(chunk_size=None):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    for chunk in iter_recipe_chunks(chunk_size):
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # the header alone when there are no recipes
+    if buffer.getvalue():
+        yield buffer.getvalue()
+
+
+EXPORT_WRITERS = {
+    'ndjson': iter_ndjson,
+    'csv': iter_csv,
+}
+
+
+def write_parquet(path, chunk_size=None):
+    """
+        Write every recipe to a Parquet file, one row group per chunk.
+
+        Needs pyarrow, the Parquet engine pandas uses.
+    """
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ('id', pa.int64()), ('title', pa.string()), ('category_id', pa.string()), ('user_id', pa.int64()),
+        ('description', pa.string()), ('ingredients', pa.string()), ('preparation_steps', pa.string()),
+        ('cooking_time', pa.int64()), ('serving_size', pa.int64()), ('rating_sum', pa.int64()),
+        ('review_count', pa.int64()), ('avg_rating', pa.float64()),
+        ('created_at', pa.timestamp('us')), ('updated_at', pa.timestamp('us')),
+    ])
+    total = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in iter_recipe_chunks(chunk_size):
+            frame = pd.DataFrame.from_records(chunk, columns=EXPORT_COLUMNS)
+            writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+            total += len(chunk)
+    return total
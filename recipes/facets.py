@@ -0,0 +1,72 @@
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from .filters import compile_filters
+from .utils import catalogue_generation
+
+# (label, exclusive upper bound in minutes), the last bucket is open ended
+COOKING_TIME_BUCKETS = (('0-15', 15), ('15-30', 30), ('30-60', 60), ('60+', None))
+# Recipes are bucketed by whole stars of avg_rating, a 5.0 average counts as 4-5
+RATING_BUCKETS = ('0-1', '1-2', '2-3', '3-4', '4-5')
+
+
+def _cooking_time_bucket_sql():
+    cases = " ".join(
+        f"WHEN trc.cooking_time < {upper} THEN '{label}'"
+        for label, upper in COOKING_TIME_BUCKETS if upper is not None
+    )
+    return f"CASE {cases} ELSE '{COOKING_TIME_BUCKETS[-1][0]}' END"
+
+
+def compute_facets(filters):
+    """
+        Count recipes per category, cooking time bucket and rating bucket.
+
+        All three facets come from a single grouped pass over tabRecipe: rows
+        are grouped by the combination of the three keys and then folded into
+        per-facet counts.
+    """
+    where_sql, params = compile_filters(filters)
+    query = f"""
+        SELECT trc.category_id AS category,
+               {_cooking_time_bucket_sql()} AS cooking_time,
+               MIN(CAST(trc.avg_rating AS INTEGER), {len(RATING_BUCKETS) - 1}) AS rating,
+               COUNT(*) AS total
+        FROM tabRecipe AS trc
+        {"WHERE " + where_sql if where_sql else ""}
+        GROUP BY 1, 2, 3
+    """
+    facets = {
+        'total': 0,
+        'category': {},
+        'cooking_time': {label: 0 for label, _ in COOKING_TIME_BUCKETS},
+        'rating': {label: 0 for label in RATING_BUCKETS},
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
+        for category, cooking_time, rating, total in cursor.fetchall():
+            facets['total'] += total
+            facets['category'][category] = facets['category'].get(category, 0) + total
+            facets['cooking_time'][cooking_time] += total
+            facets['rating'][RATING_BUCKETS[max(rating, 0)]] += total
+    return facets
+
+
+def get_facets(filters):
+    """
+        compute_facets() cached per normalized filter set.
+
+        The key is built from the compiled filter (conditions in canonical order
+        and their bound values) and the catalogue generation, which Recipe and
+        Review writes bump.
+    """
+    where_sql, params = compile_filters(filters)
+    digest = hashlib.md5(json.dumps([where_sql, params], default=str).encode()).hexdigest()
+    key = f"recipe-facets:{catalogue_generation()}:{digest}"
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(filters)
+        cache.set(key, facets, getattr(settings, 'RECIPE_FACET_CACHE_TIMEOUT', 300))
+    return facets
@@ -0,0 +1,107 @@
+from collections import namedtuple
+from functools import lru_cache
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+
+
+# A single parsed condition of the /recipes filter DSL
+FilterNode = namedtuple('FilterNode', ['field', 'operator', 'values'])
+
+# Filterable fields and the tabRecipe column each one reads
+FILTER_COLUMNS = {
+    'avg_rating': 'trc.avg_rating',
+    'title': 'trc.title',
+    'description': 'trc.description',
+    'ingredients': 'trc.ingredients',
+    'preparation_steps': 'trc.preparation_steps',
+    'cooking_time': 'trc.cooking_time',
+    'serving_size': 'trc.serving_size',
+    'category_id': 'trc.category_id',
+}
+
+MULTI_VALUE_OPERATORS = ('in', 'not in')
+# What a filter value may be, anything else cannot be bound as a parameter
+SCALAR_TYPES = (str, int, float)
+
+
+def parse_filters(filters):
+    """
+        Turn the request's ``filters`` list into FilterNodes.
+
+        Conditions without a value are skipped, as they always have been.
+        ``in`` / ``not in`` take a list of values, every other operator a
+        single one. The nodes are sorted so that the same conditions given in a different
+        order compile to the same SQL.
+    """
+    nodes = []
+    for f in filters or []:
+        field = f.get('field')
+        operator = f.get('operator')
+        value = f.get('value')
+        if not field or not operator or value is None or value == '' or value == []:
+            continue
+        if field not in FILTER_COLUMNS:
+            raise ValidationError(f"Invalid field '{field}'.")
+        if operator in MULTI_VALUE_OPERATORS:
+            if not isinstance(value, (list, tuple)) or not all(isinstance(item, SCALAR_TYPES) for item in value):
+                raise ValidationError(f"Operator '{operator}' of field '{field}' needs a list of values, each a string or a number.")
+            values = tuple(value)
+        else:
+            if not isinstance(value, SCALAR_TYPES):
+                raise ValidationError(f"Operator '{operator}' of field '{field}' needs a single string or number value.")
+            values = (value,)
+        nodes.append(FilterNode(field, operator, values))
+    return sorted(nodes, key=lambda node: (node.field, node.operator, len(node.values)))
+
+
+def filter_shape(nodes):
+    """
+        The part of a filter list that determines its SQL text: field, operator and arity.
+    """
+    return tuple((node.field, node.operator, len(node.values)) for node in nodes)
+
+
+def _compile_condition(field, operator, arity):
+    column = FILTER_COLUMNS[field]
+    if operator == '=':
+        return f"{column} = %s"
+    if operator == '!=':
+        return f"{column} != %s"
+    if operator in MULTI_VALUE_OPERATORS:
+        placeholders = ', '.join(['%s'] * arity)
+        return f"{column} {operator.upper()} ({placeholders})"
+    if operator == 'like':
+        return f"CAST({column} AS TEXT) LIKE %s ESCAPE '\\'"
+    raise ValidationError(f"Invalid Operator '{operator}'.")
+
+
+@lru_cache(maxsize=getattr(settings, 'RECIPE_FILTER_CACHE_SIZE', 256))
+def compile_shape(shape):
+    """
+        Compile a filter shape into a parameterized WHERE clause.
+
+        The result only depends on the shape, so it is memoized: repeated
+        shapes skip compilation and always send the database identical SQL
+        text, which keeps its prepared statement cache warm.
+    """
+    return ' AND '.join(_compile_condition(*condition) for condition in shape)
+
+
+def _escape_like(value):
+    return str(value).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def compile_filters(filters):
+    """
+        Compile the request's ``filters`` into ``(where_sql, params)``.
+
+        ``where_sql`` is empty when there is nothing to filter on.
+    """
+    nodes = parse_filters(filters)
+    params = []
+    for node in nodes:
+        if node.operator == 'like':
+            params.append(f"%{_escape_like(node.values[0])}%")
+        else:
+            params.extend(node.values)
+    return compile_shape(filter_shape(nodes)), params
@@ -0,0 +1,156 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import authenticate, get_backends
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import check_password, identify_hasher, make_password
+from django.contrib.auth.signals import user_logged_in, user_login_failed
+from .models import User
+
+
+class PasswordHashingBusy(Exception):
+    """
+        Raised when the password hashing pool has no room left for another job.
+    """
+
+
+class PasswordHashingPool:
+    """
+        A bounded pool of threads that hash and verify passwords.
+
+        PBKDF2 runs in OpenSSL with the GIL released, so hashing on these
+        threads keeps request threads (and the event loop of async views) free,
+        while at most ``PASSWORD_HASHING_WORKERS`` hashes run at once whatever
+        the number of concurrent logins. At most ``PASSWORD_HASHING_MAX_PENDING``
+        more jobs wait for a thread, past that submit() raises PasswordHashingBusy
+        rather than queueing without bound.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+
+    def _start(self):
+        with self._lock:
+            if self._executor is None:
+                workers = getattr(settings, 'PASSWORD_HASHING_WORKERS', None) or min(4, os.cpu_count() or 1)
+                pending = getattr(settings, 'PASSWORD_HASHING_MAX_PENDING', 64)
+                self._slots = threading.BoundedSemaphore(workers + pending)
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hashing')
+        return self._executor
+
+    def submit(self, fn, *args):
+        executor = self._start()
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHashingBusy("Too many password hashing jobs in progress")
+        try:
+            future = executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, fn, *args):
+        return self.submit(fn, *args).result()
+
+    async def arun(self, fn, *args):
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+
+hashing_pool = PasswordHashingPool()
+
+
+def hash_password(password):
+    return hashing_pool.run(make_password, password)
+
+
+async def ahash_password(password):
+    return await hashing_pool.arun(make_password, password)
+
+
+def _must_update(encoded):
+    try:
+        return identify_hasher(encoded).must_update(encoded)
+    except ValueError:
+        return False
+
+
+class HashingPoolBackend(ModelBackend):
+    """
+        ModelBackend with the password hashing run on ``hashing_pool``.
+
+        An unknown email still costs one hash, so response times do not tell
+        which emails exist, and a password stored with outdated hasher
+        parameters is re-hashed, as ``User.check_password()`` does.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        user = User._default_manager.filter(**{User.USERNAME_FIELD: username}).first()
+        if user is None:
+            hash_password(password)
+            return None
+        if not hashing_pool.run(check_password, password, user.password) or not self.user_can_authenticate(user):
+            return None
+        if _must_update(user.password):
+            user.password = hash_password(password)
+            user.save(update_fields=['password'])
+        return user
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        user = await User._default_manager.filter(**{User.USERNAME_FIELD: username}).afirst()
+        if user is None:
+            await ahash_password(password)
+            return None
+        if not await hashing_pool.arun(check_password, password, user.password) or not self.user_can_authenticate(user):
+            return None
+        if _must_update(user.password):
+            user.password = await ahash_password(password)
+            await user.asave(update_fields=['password'])
+        return user
+
+
+def authenticate_user(request, email, password):
+    """
+        The active user with these credentials, or None.
+
+        Goes through ``authenticate()`` and so AUTHENTICATION_BACKENDS, which
+        sends user_login_failed, and sends user_logged_in on success, which
+        updates last_login.
+    """
+    user = authenticate(request, **{User.USERNAME_FIELD: email, 'password': password})
+    if user is not None:
+        user_logged_in.send(sender=user.__class__, request=request, user=user)
+    return user
+
+
+async def aauthenticate_user(request, email, password):
+    """
+        authenticate_user() for async views. Backends that have an
+        ``aauthenticate()`` are awaited, the others run in a thread.
+    """
+    credentials = {User.USERNAME_FIELD: email, 'password': password}
+    for backend in get_backends():
+        if hasattr(backend, 'aauthenticate'):
+            user = await backend.aauthenticate(request, **credentials)
+        else:
+            user = await sync_to_async(backend.authenticate)(request, **credentials)
+        if user is not None:
+            user.backend = f"{backend.__module__}.{backend.__class__.__qualname__}"
+            await user_logged_in.asend(sender=user.__class__, request=request, user=user)
+            return user
+    # Only the username, as authenticate() never passes on the password
+    await user_login_failed.asend(sender=__name__, credentials={User.USERNAME_FIELD: email}, request=request)
+    return None
@@ -0,0 +1,271 @@
+import csv
+import json
+from collections import defaultdict
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from rest_framework.exceptions import ValidationError
+from .autocomplete import prefix_index
+from .detail_cache import invalidate_recipe_detail
+from .constant import USER_CONFLICT_MESSAGES
+from .models import Category, Recipe, Review, User
+from .serializers import BatchReviewItemSerializer, HashedUserSerializer, ImportRecipeSerializer
+from .utils import bump_catalogue_generation, violated_unique_field
+
+
+def after_bulk_review_write(rating_deltas):
+    """
+        What the Review save signals do for single writes, once per recipe.
+
+        ``bulk_create()`` sends no signals, so a bulk write of reviews applies
+        the rating aggregate deltas itself, ``{recipe_id: (rating_delta,
+        count_delta)}``, and schedules the cache invalidations for commit.
+    """
+    for recipe_id, (rating_delta, count_delta) in rating_deltas.items():
+        Recipe.objects.apply_rating_delta(recipe_id, rating_delta, count_delta)
+
+    def on_commit():
+        bump_catalogue_generation()
+        invalidate_recipe_detail(*rating_deltas)
+        for recipe_id, (_, count_delta) in rating_deltas.items():
+            prefix_index.add_reviews(recipe_id, count_delta)
+
+    transaction.on_commit(on_commit)
+
+
+def ingest_reviews(user, items):
+    """
+        Create the valid reviews of a batch for ``user``.
+
+        Every item is validated on its own and the recipes of the whole batch
+        are checked with a single ``IN`` query. The valid reviews are inserted
+        with ``bulk_create()`` and the rating aggregates of their recipes are
+        updated with one UPDATE per recipe, all in one transaction.
+
+        Returns the created reviews and the ``{index, errors}`` of the
+        rejected items.
+    """
+    item_serializer = BatchReviewItemSerializer()
+    errors = []
+    valid = []
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, item_serializer.run_validation(item)))
+        except ValidationError as exc:
+            errors.append({'index': index, 'errors': exc.detail})
+
+    recipe_ids = {data['recipe'] for _, data in valid}
+    existing = set(Recipe.objects.filter(pk__in=recipe_ids).values_list('pk', flat=True)) if recipe_ids else set()
+
+    reviews = []
+    rating_deltas = defaultdict(lambda: (0, 0))
+    for index, data in valid:
+        recipe_id = data['recipe']
+        if recipe_id not in existing:
+            errors.append({'index': index, 'errors': {'recipe': [f'Invalid pk "{recipe_id}" - object does not exist.']}})
+            continue
+        reviews.append(Review(user=user, recipe_id=recipe_id, rating=data['rating'], comment=data['comment']))
+        rating_sum, review_count = rating_deltas[recipe_id]
+        rating_deltas[recipe_id] = (rating_sum + data['rating'], review_count + 1)
+
+    if reviews:
+        with transaction.atomic():
+            Review.objects.bulk_create(reviews, batch_size=settings.REVIEW_BATCH_INSERT_SIZE)
+            after_bulk_review_write(rating_deltas)
+
+    errors.sort(key=lambda error: error['index'])
+    return reviews, errors
+
+
+def iter_ndjson_rows(lines):
+    """
+        ``(line number, row)`` of every non blank line, row is None when the line is not a JSON object.
+    """
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_number, row if isinstance(row, dict) else None
+
+
+def iter_csv_rows(lines):
+    reader = csv.DictReader(lines)
+    for row in reader:
+        yield reader.line_num, row
+
+
+IMPORT_READERS = {
+    'ndjson': iter_ndjson_rows,
+    'csv': iter_csv_rows,
+}
+
+
+def get_import_chunk_size(chunk_size=None):
+    return chunk_size or getattr(settings, 'RECIPE_IMPORT_CHUNK_SIZE', 1000)
+
+
+def import_recipes(user, rows, chunk_size=None):
+    """
+        Create recipes owned by ``user`` from ``(line, row)`` pairs, chunk by chunk.
+
+        Rows are validated like CreateRecipeSerializer does, but the categories
+        are loaded once and the titles of a chunk are checked with one query.
+        Each chunk is inserted with ``bulk_create()`` in its own transaction, so
+        a long import never holds the database for its whole duration, and a
+        rejected row never aborts the others.
+
+        Returns the number of recipes created and the ``{line, errors}`` of the
+        rejected rows.
+    """
+    chunk_size = get_import_chunk_size(chunk_size)
+    row_serializer = ImportRecipeSerializer(context={'categories': set(Category.objects.values_list('name', flat=True))})
+    created = 0
+    errors = []
+    chunk = []
+    for line, row in rows:
+        if row is None:
+            errors.append({'line': line, 'errors': {'non_field_errors': ['Invalid JSON object.']}})
+            continue
+        try:
+            chunk.append((line, row_serializer.run_validation(row)))
+        except ValidationError as exc:
+            errors.append({'line': line, 'errors': exc.detail})
+            continue
+        if len(chunk) >= chunk_size:
+            created += _import_recipe_chunk(user, chunk, errors)
+            chunk = []
+    if chunk:
+        created += _import_recipe_chunk(user, chunk, errors)
+
+    errors.sort(key=lambda error: error['line'])
+    return created, errors
+
+
+def _title_conflict(line):
+    return {'line': line, 'errors': {'title': ['recipe with this title already exists.']}}
+
+
+def _import_recipe_chunk(user, chunk, errors):
+    # Earlier chunks are committed already, so the query also sees their titles
+    taken = set(Recipe.objects.filter(title__in=[data['title'] for _, data in chunk]).values_list('title', flat=True))
+    recipes = []
+    for line, data in chunk:
+        if data['title'] in taken:
+            errors.append(_title_conflict(line))
+            continue
+        taken.add(data['title'])
+        recipes.append((line, Recipe(user=user, **data)))
+    if not recipes:
+        return 0
+
+    try:
+        with transaction.atomic():
+            Recipe.objects.bulk_create([recipe for _, recipe in recipes])
+            after_bulk_recipe_create([recipe for _, recipe in recipes])
+        return len(recipes)
+    except IntegrityError:
+        pass
+
+    # A title was taken concurrently, find out which row by row
+    created = 0
+    for line, recipe in recipes:
+        recipe.pk = None
+        try:
+            with transaction.atomic():
+                Recipe.objects.bulk_create([recipe])
+                after_bulk_recipe_create([recipe])
+        except IntegrityError:
+            errors.append(_title_conflict(line))
+        else:
+            created += 1
+    return created
+
+
+def after_bulk_recipe_create(recipes):
+    # What the Recipe post_save signals do for single writes, bulk_create() sends none
+    def on_commit():
+        bump_catalogue_generation()
+        for recipe in recipes:
+            prefix_index.update_recipe(recipe)
+
+    transaction.on_commit(on_commit)
+
+
+def bulk_create_users(rows, batch_size=None):
+    """
+        Create users with pre-hashed passwords from ``(line, row)`` pairs, batch by batch.
+
+        Emails and phone numbers already taken, in the database or earlier in
+        the file, are found with one query per field and batch. Each batch is
+        inserted with ``bulk_create()`` in its own transaction.
+
+        Returns the number of users created and the ``{line, errors}`` of the
+        rejected rows.
+    """
+    batch_size = batch_size or getattr(settings, 'USER_BULK_CREATE_BATCH_SIZE', 1000)
+    row_serializer = HashedUserSerializer()
+    created = 0
+    errors = []
+    batch = []
+    for line, row in rows:
+        if row is None:
+            errors.append({'line': line, 'errors': {'non_field_errors': ['Invalid JSON object.']}})
+            continue
+        try:
+            batch.append((line, User.objects.build_user(**row_serializer.run_validation(row))))
+        except ValidationError as exc:
+            errors.append({'line': line, 'errors': exc.detail})
+            continue
+        if len(batch) >= batch_size:
+            created += _create_user_batch(batch, errors)
+            batch = []
+    if batch:
+        created += _create_user_batch(batch, errors)
+
+    errors.sort(key=lambda error: error['line'])
+    return created, errors
+
+
+def _user_conflict(line, field):
+    return {'line': line, 'errors': {field: [USER_CONFLICT_MESSAGES.get(field, 'Already used.')]}}
+
+
+def _create_user_batch(batch, errors):
+    taken = {
+        field: set(User.objects.filter(**{f'{field}__in': [getattr(user, field) for _, user in batch]})
+                   .values_list(field, flat=True))
+        for field in USER_CONFLICT_MESSAGES
+    }
+    users = []
+    for line, user in batch:
+        field = next((field for field in taken if getattr(user, field) in taken[field]), None)
+        if field is not None:
+            errors.append(_user_conflict(line, field))
+            continue
+        for field in taken:
+            taken[field].add(getattr(user, field))
+        users.append((line, user))
+    if not users:
+        return 0
+
+    try:
+        with transaction.atomic():
+            User.objects.bulk_create([user for _, user in users])
+        return len(users)
+    except IntegrityError:
+        pass
+
+    # Taken concurrently, find out which rows by inserting them one by one
+    created = 0
+    for line, user in users:
+        user.pk = None
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create([user])
+        except IntegrityError as exc:
+            errors.append(_user_conflict(line, violated_unique_field(exc, User)))
+        else:
+            created += 1
+    return created
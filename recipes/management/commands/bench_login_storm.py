@@ -0,0 +1,106 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from recipes.models import User
+
+BENCH_EMAIL = 'bench-login@example.com'
+BENCH_PASSWORD = 'bench-login-password'
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure login throughput, and the latency of another endpoint with and "
+        "without a concurrent login storm, against a running server"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000/api')
+        parser.add_argument('--login-path', default='/login', help="/login, or /login/async under ASGI")
+        parser.add_argument('--probe-path', default='/home', help="Endpoint whose latency is measured")
+        parser.add_argument('--logins', type=int, default=32, help="Concurrent login clients")
+        parser.add_argument('--probes', type=int, default=4, help="Concurrent clients of the probed endpoint")
+        parser.add_argument('--duration', type=float, default=10, help="Seconds per phase")
+
+    def handle(self, *args, **options):
+        if not User.objects.filter(email=BENCH_EMAIL).exists():
+            User.objects.create_user(email=BENCH_EMAIL, password=BENCH_PASSWORD, first_name='Bench',
+                                     last_name='Login', phone_number='000-bench')
+        self.base_url = options['base_url'].rstrip('/')
+        try:
+            self.request(options['probe_path'])
+        except OSError as exc:
+            raise CommandError(f"{self.base_url} is not reachable: {exc}")
+
+        results = []
+        if options['probes']:
+            self.stdout.write(f"Baseline: {options['probes']} client(s) on {options['probe_path']} for {options['duration']}s")
+            results.append(('baseline', self.run_phase(options, logins=0)))
+        # With --probes 0, login throughput alone
+        self.stdout.write(f"Storm: {options['logins']} login client(s) on {options['login_path']}")
+        storm = self.run_phase(options, logins=options['logins'])
+        if options['probes']:
+            results.append(('storm', storm))
+
+        for name, result in results:
+            probe = result['probe']
+            self.stdout.write(
+                f"{name:>8}: probe {len(probe) / result['elapsed']:.1f} req/s "
+                f"p50 {self.ms(percentile(probe, 0.50))} p99 {self.ms(percentile(probe, 0.99))}"
+            )
+        logins = storm['login']
+        self.stdout.write(
+            f"   login: {len(logins) / storm['elapsed']:.1f} ok/s, p99 {self.ms(percentile(logins, 0.99))}, "
+            f"{storm['busy']} answered 503, {storm['failed']} failed"
+        )
+
+    def ms(self, seconds):
+        return f"{seconds * 1000:.1f}ms" if seconds is not None else "n/a"
+
+    def request(self, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=60) as response:
+            response.read()
+            return response.status
+
+    def run_phase(self, options, logins):
+        result = {'probe': [], 'login': [], 'busy': 0, 'failed': 0}
+        lock = threading.Lock()
+        stop = time.monotonic() + options['duration']
+        credentials = {'email': BENCH_EMAIL, 'password': BENCH_PASSWORD}
+
+        def client(path, body, samples):
+            while time.monotonic() < stop:
+                started = time.perf_counter()
+                try:
+                    self.request(path, body)
+                except urllib.error.HTTPError as exc:
+                    with lock:
+                        result['busy' if exc.code == 503 else 'failed'] += 1
+                    continue
+                except OSError:
+                    with lock:
+                        result['failed'] += 1
+                    continue
+                with lock:
+                    result[samples].append(time.perf_counter() - started)
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['probes'] + logins) as executor:
+            for _ in range(options['probes']):
+                executor.submit(client, options['probe_path'], None, 'probe')
+            for _ in range(logins):
+                executor.submit(client, options['login_path'], credentials, 'login')
+        result['elapsed'] = time.monotonic() - started
+        return result
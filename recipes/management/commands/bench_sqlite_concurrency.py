@@ -0,0 +1,123 @@
+import multiprocessing
+import random
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections, transaction
+from recipes.models import Recipe, Review, User
+from .bench_login_storm import percentile
+
+BENCH_EMAIL = 'bench-sqlite@example.com'
+BENCH_COMMENT = 'bench-sqlite-concurrency'
+PAGE_SIZE = 20
+
+
+def read_recipe_page(recipe_count):
+    # What a /recipes page costs: the COUNT(*) and one page by id
+    offset = random.randrange(max(recipe_count - PAGE_SIZE, 1))
+    Recipe.objects.count()
+    list(Recipe.objects.order_by('id').values()[offset:offset + PAGE_SIZE])
+
+
+def write_review(user_id, recipe_ids):
+    # As POST /reviews: the review and the rating aggregates of its recipe
+    with transaction.atomic():
+        Review.objects.create(user_id=user_id, recipe_id=random.choice(recipe_ids),
+                              rating=random.randint(0, 5), comment=BENCH_COMMENT)
+
+
+def run_worker(role, pragmas, stop_at, user_id, recipe_ids, results):
+    # Forked with the parent's settings, applied by recipes.signals on connect
+    settings.SQLITE_PRAGMAS = pragmas
+    samples, locked = [], 0
+    while time.monotonic() < stop_at:
+        started = time.perf_counter()
+        try:
+            if role == 'read':
+                read_recipe_page(len(recipe_ids))
+            else:
+                write_review(user_id, recipe_ids)
+        except OperationalError:
+            # "database is locked", the busy timeout ran out or there was none
+            locked += 1
+            continue
+        samples.append(time.perf_counter() - started)
+    connections.close_all()
+    results.put((role, samples, locked))
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure read and write throughput of concurrent processes on the SQLite "
+        "database, under each SQLITE_PRAGMA_PROFILES profile"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4, help="Reader processes, each reading /recipes pages")
+        parser.add_argument('--writers', type=int, default=2, help="Writer processes, each creating reviews")
+        parser.add_argument('--duration', type=float, default=10, help="Seconds per profile")
+        parser.add_argument('--profiles', nargs='+', default=['default', 'tuned'],
+                            choices=sorted(settings.SQLITE_PRAGMA_PROFILES))
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("The default database is not SQLite.")
+        recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+        if not recipe_ids:
+            raise CommandError("There are no recipes to read or review, import some first.")
+        user, _ = User.objects.get_or_create(email=BENCH_EMAIL, defaults={
+            'first_name': 'Bench', 'last_name': 'SQLite', 'phone_number': '000-bench-db',
+        })
+
+        results = {}
+        try:
+            for profile in options['profiles']:
+                self.stdout.write(f"{profile}: {options['readers']} reader(s), {options['writers']} writer(s) "
+                                  f"for {options['duration']}s")
+                results[profile] = self.run_profile(profile, options, user.pk, recipe_ids)
+        finally:
+            settings.SQLITE_PRAGMAS = settings.SQLITE_PRAGMA_PROFILES[settings.SQLITE_PRAGMA_PROFILE]
+            connections.close_all()
+            # Deleted one by one, the signals take the ratings back out of the aggregates
+            deleted, _ = Review.objects.filter(user=user, comment=BENCH_COMMENT).delete()
+            self.stdout.write(f"Removed {deleted} benchmark review(s)")
+
+        for profile, result in results.items():
+            for role in ('read', 'write'):
+                samples, locked = result[role]
+                self.stdout.write(
+                    f"{profile:>8} {role:>5}: {len(samples) / options['duration']:.1f} ops/s "
+                    f"p50 {self.ms(percentile(samples, 0.50))} p99 {self.ms(percentile(samples, 0.99))}, "
+                    f"{locked} locked"
+                )
+
+    def ms(self, seconds):
+        return f"{seconds * 1000:.1f}ms" if seconds is not None else "n/a"
+
+    def run_profile(self, profile, options, user_id, recipe_ids):
+        pragmas = settings.SQLITE_PRAGMA_PROFILES[profile]
+        # journal_mode is stored in the database file: switch it once, before
+        # the workers open their connections
+        settings.SQLITE_PRAGMAS = pragmas
+        connections.close_all()
+        connection.ensure_connection()
+        connections.close_all()
+
+        # Forked, so the workers share the loaded Django setup
+        context = multiprocessing.get_context('fork')
+        queue = context.Queue()
+        stop_at = time.monotonic() + options['duration']
+        roles = ['read'] * options['readers'] + ['write'] * options['writers']
+        workers = [
+            context.Process(target=run_worker, args=(role, pragmas, stop_at, user_id, recipe_ids, queue))
+            for role in roles
+        ]
+        for worker in workers:
+            worker.start()
+        result = {'read': ([], 0), 'write': ([], 0)}
+        for _ in workers:
+            role, samples, locked = queue.get()
+            result[role] = (result[role][0] + samples, result[role][1] + locked)
+        for worker in workers:
+            worker.join()
+        return result
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipes.ingest import IMPORT_READERS, bulk_create_users
+
+
+class Command(BaseCommand):
+    help = (
+        "Create users from an NDJSON or CSV file of email, password, first_name, last_name "
+        "and phone_number, the password already hashed (see make_password())"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to load")
+        parser.add_argument('--format', choices=list(IMPORT_READERS), help="Defaults to the file extension")
+        parser.add_argument('--batch-size', type=int, help="Users inserted per transaction")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if file_format not in IMPORT_READERS:
+            raise CommandError(f"Unknown format {file_format!r}, use --format {' or '.join(IMPORT_READERS)}")
+
+        with open(path, newline='', encoding='utf-8') as stream:
+            created, errors = bulk_create_users(IMPORT_READERS[file_format](stream), options['batch_size'])
+
+        for error in errors:
+            self.stderr.write(f"line {error['line']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(f"Created {created} user(s), rejected {len(errors)} row(s)"))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipes.exporters import EXPORT_WRITERS, write_parquet
+
+
+class Command(BaseCommand):
+    help = "Stream every recipe with its rating aggregates to NDJSON, CSV or Parquet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=[*EXPORT_WRITERS, 'parquet'], default='ndjson')
+        parser.add_argument('--output', help="File to write to, standard output when omitted (not for parquet)")
+        parser.add_argument('--chunk-size', type=int, help="Rows fetched from the database at a time")
+
+    def handle(self, *args, **options):
+        file_format = options['format']
+        output = options['output']
+
+        if file_format == 'parquet':
+            if not output:
+                raise CommandError("--output is required for parquet exports")
+            try:
+                total = write_parquet(output, options['chunk_size'])
+            except ImportError:
+                raise CommandError("Parquet export needs pyarrow: pip install pyarrow")
+            self.stderr.write(self.style.SUCCESS(f"Exported {total} recipe(s) to {output}"))
+            return
+
+        if not output:
+            for part in EXPORT_WRITERS[file_format](options['chunk_size']):
+                self.stdout.write(part, ending='')
+            return
+
+        with open(output, 'w', newline='', encoding='utf-8') as stream:
+            for part in EXPORT_WRITERS[file_format](options['chunk_size']):
+                stream.write(part)
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipes.ingest import IMPORT_READERS, import_recipes
+from recipes.models import User
+
+
+class Command(BaseCommand):
+    help = "Create recipes from an NDJSON or CSV file, rejected rows are reported and skipped"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import")
+        parser.add_argument('--user', required=True, help="Email of the user the recipes are created for")
+        parser.add_argument('--format', choices=list(IMPORT_READERS), help="Defaults to the file extension")
+        parser.add_argument('--chunk-size', type=int, help="Rows inserted per transaction")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if file_format not in IMPORT_READERS:
+            raise CommandError(f"Unknown format {file_format!r}, use --format {' or '.join(IMPORT_READERS)}")
+        try:
+            user = User.objects.get(email=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user with email {options['user']}")
+
+        with open(path, newline='', encoding='utf-8') as stream:
+            created, errors = import_recipes(user, IMPORT_READERS[file_format](stream), options['chunk_size'])
+
+        for error in errors:
+            self.stderr.write(f"line {error['line']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(f"Imported {created} recipe(s), rejected {len(errors)} row(s)"))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Rebuild (or verify) the rating_sum, review_count and avg_rating columns of tabRecipe from tabReview"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help="Only report recipes whose stored aggregates are out of date, exit non-zero if any are found",
+        )
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            mismatches = Recipe.objects.rating_aggregate_mismatches()
+            for row in mismatches:
+                self.stdout.write(
+                    f"Recipe {row['id']}: stored sum={row['rating_sum']} count={row['review_count']} "
+                    f"avg={row['avg_rating']}, expected sum={row['expected_rating_sum']} "
+                    f"count={row['expected_review_count']} avg={row['expected_avg_rating']}"
+                )
+            if mismatches:
+                raise CommandError(f"{len(mismatches)} recipe(s) have stale rating aggregates")
+            self.stdout.write(self.style.SUCCESS("All rating aggregates are up to date"))
+            return
+
+        updated = Recipe.objects.rebuild_rating_aggregates()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rating aggregates for {updated} recipe(s)"))
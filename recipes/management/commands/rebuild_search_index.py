@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from recipes.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Recreate the recipe full-text search index and its sync triggers, then reindex every recipe"
+
+    def handle(self, *args, **options):
+        rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS("Recipe search index rebuilt"))
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.6 on 2026-10-18 18:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_alter_recipe_title'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='avg_rating',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='review_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['avg_rating', 'id'], name='recipe_avg_rating_idx'),
+        ),
+        migrations.RunSQL(
+            sql="""
+                UPDATE tabRecipe SET
+                    rating_sum = COALESCE((SELECT SUM(rating) FROM tabReview WHERE recipe_id = tabRecipe.id), 0),
+                    review_count = (SELECT COUNT(*) FROM tabReview WHERE recipe_id = tabRecipe.id),
+                    avg_rating = COALESCE((SELECT AVG(rating) FROM tabReview WHERE recipe_id = tabRecipe.id), 0)
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+from recipes.search import drop_search_index_sql, search_index_sql
+
+
+# Full-text index over tabRecipe, kept in sync by triggers. The statements are
+# defined once, in recipes.search, which also puts the triggers back after
+# later migrations.
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in search_index_sql('tabRecipeSearch'):
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in drop_search_index_sql('tabRecipeSearch'):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_ordering_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+from recipes.search import drop_search_index_sql, search_index_sql
+
+
+# Trigram index over recipe titles and ingredients, used to find candidates
+# for typo tolerant search. Kept in sync with tabRecipe by triggers, defined
+# in recipes.search.
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in search_index_sql('tabRecipeTrigram'):
+        schema_editor.execute(statement)
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in drop_search_index_sql('tabRecipeTrigram'):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
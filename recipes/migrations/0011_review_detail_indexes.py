@@ -0,0 +1,21 @@
+# Generated by Django 5.0.6 on 2026-10-18 18:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['recipe', 'created_at', 'id'], name='review_recipe_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['recipe', 'rating'], name='review_recipe_rating_idx'),
+        ),
+    ]
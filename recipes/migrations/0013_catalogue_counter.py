@@ -0,0 +1,29 @@
+# Generated by Django 5.0.6 on 2026-10-18 19:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_review_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogueCounter',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Catalogue counter',
+                'db_table': 'tabCatalogueCounter',
+            },
+        ),
+        # bump() only UPDATEs, the row must exist beforehand
+        migrations.RunSQL(
+            sql="INSERT INTO tabCatalogueCounter (name, value) VALUES ('recipe_deletes', 0)",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -1,4 +1,7 @@
-from django.db import models
+from django.db import models, connection, transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Cast
+from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.core.validators import MinValueValidator, MaxValueValidator
 from .validators import validate_rating
@@ -7,14 +10,20 @@ from .validators import validate_rating
 class CustomUserManager(BaseUserManager):
 
     def create_user(self, email, password=None, **extra_fields):
-        if not email:
-            raise ValueError('The Email field must be set')
-        email = self.normalize_email(email)
-        user = self.model(email=email, **extra_fields)
+        user = self.build_user(email, **extra_fields)
         user.set_password(password)
         user.save(using=self._db)
         return user
 
+    def build_user(self, email, **extra_fields):
+        """
+            An unsaved user, ``password`` (when given) must already be hashed.
+        """
+        if not email:
+            raise ValueError('The Email field must be set')
+        email = self.normalize_email(email)
+        return self.model(email=email, **extra_fields)
+
     def create_superuser(self, email, password=None, **extra_fields):
         extra_fields.setdefault('is_staff', True)
         extra_fields.setdefault('is_superuser', True)
@@ -69,6 +78,113 @@ class Category(models.Model):
         verbose_name = 'Category'
         verbose_name_plural = 'Categories'
     
+class RecipeManager(models.Manager):
+
+    def apply_rating_delta(self, recipe_id, rating_delta, count_delta):
+        """
+            Shift a recipe's stored rating aggregates by the given deltas in a single
+            UPDATE, so concurrent review writes never overwrite each other.
+
+            updated_at is bumped as well: the recipe's detail (which embeds its
+            reviews) changes with every review write, and HTTP validators are
+            derived from it.
+        """
+        rating_sum = F('rating_sum') + rating_delta
+        review_count = F('review_count') + count_delta
+        return self.filter(pk=recipe_id).update(
+            updated_at=timezone.now(),
+            rating_sum=rating_sum,
+            review_count=review_count,
+            avg_rating=Case(
+                When(review_count__gt=-count_delta, then=Cast(rating_sum, FloatField()) / review_count),
+                default=Value(0.0),
+            ),
+        )
+
+    def rebuild_rating_aggregates(self):
+        """
+            Recompute rating_sum, review_count and avg_rating of every recipe from tabReview.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(REBUILD_RATING_AGGREGATES_SQL)
+            return cursor.rowcount
+
+    def list_version(self):
+        """
+            What the recipe list's ETag is derived from, read in one query:
+            the number of recipe deletes (a delete moves no updated_at) and
+            MAX(updated_at), a single lookup on recipe_updated_at_idx.
+
+            Both live in the database, so every worker sees the writes made
+            through the others.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT (SELECT value FROM tabCatalogueCounter WHERE name = %s),
+                       (SELECT MAX(updated_at) FROM tabRecipe)
+            """, [CatalogueCounter.RECIPE_DELETES])
+            return cursor.fetchone()
+
+    def rating_aggregate_mismatches(self):
+        """
+            Return the recipes whose stored aggregates disagree with tabReview.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT trc.id, trc.rating_sum, trc.review_count, trc.avg_rating,
+                       COALESCE(SUM(tr.rating), 0) AS expected_rating_sum,
+                       COUNT(tr.id) AS expected_review_count,
+                       COALESCE(AVG(tr.rating), 0) AS expected_avg_rating
+                FROM tabRecipe AS trc
+                LEFT JOIN tabReview AS tr ON trc.id = tr.recipe_id
+                GROUP BY trc.id
+                HAVING trc.rating_sum != expected_rating_sum
+                    OR trc.review_count != expected_review_count
+                    OR ABS(trc.avg_rating - expected_avg_rating) > 1e-9
+            """)
+            columns = [col[0] for col in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+REBUILD_RATING_AGGREGATES_SQL = """
+    UPDATE tabRecipe SET
+        rating_sum = COALESCE((SELECT SUM(rating) FROM tabReview WHERE recipe_id = tabRecipe.id), 0),
+        review_count = (SELECT COUNT(*) FROM tabReview WHERE recipe_id = tabRecipe.id),
+        avg_rating = COALESCE((SELECT AVG(rating) FROM tabReview WHERE recipe_id = tabRecipe.id), 0)
+"""
+
+
+class CatalogueCounterManager(models.Manager):
+
+    def bump(self, name):
+        """
+            Add one to the counter ``name`` in a single UPDATE, as part of the
+            caller's transaction.
+        """
+        return self.filter(name=name).update(value=F('value') + 1)
+
+
+class CatalogueCounter(models.Model):
+    """
+        Counters of catalogue writes that leave no other trace in the tables,
+        shared by every worker.
+    """
+    # Bumped by recipes.signals when a recipe is deleted
+    RECIPE_DELETES = 'recipe_deletes'
+
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    objects = CatalogueCounterManager()
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
+    class Meta:
+        db_table = "tabCatalogueCounter"
+        verbose_name = 'Catalogue counter'
+
+
 class Recipe(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     title = models.CharField(max_length=100, unique=True)
@@ -80,14 +196,42 @@ class Recipe(models.Model):
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized from tabReview, maintained by recipes.signals
+    rating_sum = models.IntegerField(default=0)
+    review_count = models.IntegerField(default=0)
+    avg_rating = models.FloatField(default=0)
+
+    objects = RecipeManager()
+
+    # Only ever changed by RecipeManager.apply_rating_delta()/rebuild_rating_aggregates()
+    RATING_AGGREGATE_FIELDS = ('rating_sum', 'review_count', 'avg_rating')
     
     def __str__(self) -> str:
         return self.title
+
+    def save(self, *args, **kwargs):
+        # The aggregates a loaded instance holds go stale with the next review
+        # write, an update of the recipe must not write them back
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.RATING_AGGREGATE_FIELDS
+            ]
+        super().save(*args, **kwargs)
     
     class Meta:
         db_table = "tabRecipe"
         verbose_name = 'Recipe'
         verbose_name_plural = 'Recipes'
+        # One index per sortable field of the recipe list (title is already unique)
+        indexes = [
+            models.Index(fields=['avg_rating', 'id'], name='recipe_avg_rating_idx'),
+            models.Index(fields=['cooking_time', 'id'], name='recipe_cooking_time_idx'),
+            models.Index(fields=['serving_size', 'id'], name='recipe_serving_size_idx'),
+            models.Index(fields=['created_at', 'id'], name='recipe_created_at_idx'),
+            # MAX(updated_at) for the recipe list's validators
+            models.Index(fields=['updated_at'], name='recipe_updated_at_idx'),
+        ]
 
 
 class Review(models.Model):
@@ -96,11 +240,24 @@ class Review(models.Model):
     rating = models.IntegerField(validators=[validate_rating])
     comment = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.recipe.title} - {self.rating}"
+
+    def save(self, *args, **kwargs):
+        # The recipe's rating aggregates are updated from the save signals,
+        # keep them in the same transaction as the review itself, along with
+        # the lock pre_save takes on the review's row.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
     
     class Meta:
         db_table = "tabReview"
         verbose_name = 'Review'
-        verbose_name_plural = 'Reviews'
\ No newline at end of file
+        verbose_name_plural = 'Reviews'
+        # Newest-first review pages and the rating histogram of a recipe
+        indexes = [
+            models.Index(fields=['recipe', 'created_at', 'id'], name='review_recipe_created_idx'),
+            models.Index(fields=['recipe', 'rating'], name='review_recipe_rating_idx'),
+        ]
\ No newline at end of file
@@ -0,0 +1,157 @@
+import base64
+import binascii
+import json
+from django.db import connection
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from .constant import CustomPagination
+from .utils import dictfetchall
+
+
+# Sortable fields of the recipe list. Each has an index on (field, id) so
+# every ordering, ascending or descending, is an index scan.
+RECIPE_ORDERING_FIELDS = ('avg_rating', 'cooking_time', 'serving_size', 'created_at', 'title')
+ORDERING_QUERY_PARAM = 'ordering'
+# What a cursor's sort key may be, anything else cannot be bound as a parameter
+CURSOR_VALUE_TYPES = (str, int, float, type(None))
+
+
+def encode_cursor(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(token, invalid_message='Invalid cursor'):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (binascii.Error, ValueError, TypeError):
+        raise NotFound(invalid_message)
+    if not isinstance(payload, dict):
+        raise NotFound(invalid_message)
+    return payload
+
+
+def get_ordering(request, default=None):
+    """
+        Read and validate the ``ordering`` query parameter, e.g. ``-avg_rating``.
+    """
+    ordering = request.query_params.get(ORDERING_QUERY_PARAM) or default
+    if ordering is not None and ordering.lstrip('-') not in RECIPE_ORDERING_FIELDS:
+        raise ValidationError({ORDERING_QUERY_PARAM: f"Ordering must be one of: {', '.join(RECIPE_ORDERING_FIELDS)} (prefix with '-' for descending)."})
+    return ordering
+
+
+def order_by_sql(ordering, reverse=False):
+    """
+        ORDER BY terms for an ordering, with id as the tie breaker in the same direction.
+    """
+    if ordering is None:
+        return 'id DESC' if reverse else 'id'
+    direction = 'DESC' if ordering.startswith('-') != reverse else 'ASC'
+    return f"{ordering.lstrip('-')} {direction}, id {direction}"
+
+
+class KeysetPagination(BasePagination):
+    """
+        Cursor (keyset) pagination over a raw recipe query.
+
+        Pages are read with ``WHERE (sort_key, id) < (last_key, last_id)``
+        instead of ``OFFSET``, so every page costs the same no matter how deep
+        the client has scrolled. Cursors are opaque base64 tokens that carry
+        the sort key of the page boundary and the direction of travel.
+    """
+    page_size = CustomPagination.page_size
+    page_size_query_param = 'page_size'
+    max_page_size = CustomPagination.max_page_size
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    default_ordering = '-created_at'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def encode_cursor(self, row, reverse):
+        field = self.ordering.lstrip('-')
+        value = row[field]
+        if value is not None and not isinstance(value, (int, float, str)):
+            value = str(value)
+        token = encode_cursor({'o': self.ordering, 'v': value, 'id': row['id'], 'r': int(reverse)})
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        payload = decode_cursor(token, self.invalid_cursor_message)
+        try:
+            cursor = (payload['v'], int(payload['id']), bool(payload['r']))
+        except (ValueError, TypeError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(cursor[0], CURSOR_VALUE_TYPES) or payload.get('o') != self.ordering:
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    @staticmethod
+    def get_page_sql(query, params, ordering, cursor, page_size):
+        """
+            SQL for one page after (or, for a reverse cursor, before) ``cursor``.
+
+            One extra row is fetched to tell whether another page follows.
+        """
+        reverse = bool(cursor and cursor[2])
+        descending = ordering.startswith('-') != reverse
+        sql = f"SELECT * FROM ({query}) AS keyset"
+        params = list(params or [])
+        if cursor is not None:
+            sql += f" WHERE ({ordering.lstrip('-')}, id) {'<' if descending else '>'} (%s, %s)"
+            params += [cursor[0], cursor[1]]
+        sql += f" ORDER BY {order_by_sql(ordering, reverse)} LIMIT %s"
+        params.append(page_size + 1)
+        return sql, params
+
+    def paginate_raw_query(self, query, params, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = get_ordering(request, self.default_ordering)
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor[2])
+
+        sql, params = self.get_page_sql(query, params, self.ordering, cursor, self.page_size)
+        with connection.cursor() as db_cursor:
+            db_cursor.execute(sql, params)
+            rows = dictfetchall(db_cursor)
+
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = cursor is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.page = rows
+        return rows
+
+    def get_next_link(self):
+        if not (self.has_next and self.page):
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
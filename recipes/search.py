@@ -0,0 +1,221 @@
+import re
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from .utils import LazyRawQuery, dictfetchall
+
+# bm25() column weights, in tabRecipeSearch column order:
+# title, category_id, description, ingredients
+SEARCH_COLUMN_WEIGHTS = (10.0, 5.0, 1.0, 2.0)
+
+# The full-text and trigram indexes over tabRecipe, kept in sync by triggers.
+# Both are external content tables, so the text is only stored once, in
+# tabRecipe. Migrations 0009 and 0010 create them from these statements, and
+# ensure_search_triggers() puts the triggers back after any migration: SQLite
+# drops a table's triggers when Django rebuilds the table.
+SEARCH_INDEXES = {
+    'tabRecipeSearch': {
+        'table': """
+            CREATE VIRTUAL TABLE IF NOT EXISTS tabRecipeSearch USING fts5(
+                title, category_id, description, ingredients,
+                content='tabRecipe', content_rowid='id',
+                tokenize='porter unicode61 remove_diacritics 2'
+            )
+        """,
+        'triggers': {
+            'tabRecipe_search_insert': """
+                CREATE TRIGGER IF NOT EXISTS tabRecipe_search_insert AFTER INSERT ON tabRecipe BEGIN
+                    INSERT INTO tabRecipeSearch(rowid, title, category_id, description, ingredients)
+                    VALUES (new.id, new.title, new.category_id, new.description, new.ingredients);
+                END
+            """,
+            'tabRecipe_search_delete': """
+                CREATE TRIGGER IF NOT EXISTS tabRecipe_search_delete AFTER DELETE ON tabRecipe BEGIN
+                    INSERT INTO tabRecipeSearch(tabRecipeSearch, rowid, title, category_id, description, ingredients)
+                    VALUES ('delete', old.id, old.title, old.category_id, old.description, old.ingredients);
+                END
+            """,
+            'tabRecipe_search_update': """
+                CREATE TRIGGER IF NOT EXISTS tabRecipe_search_update
+                AFTER UPDATE OF title, category_id, description, ingredients ON tabRecipe BEGIN
+                    INSERT INTO tabRecipeSearch(tabRecipeSearch, rowid, title, category_id, description, ingredients)
+                    VALUES ('delete', old.id, old.title, old.category_id, old.description, old.ingredients);
+                    INSERT INTO tabRecipeSearch(rowid, title, category_id, description, ingredients)
+                    VALUES (new.id, new.title, new.category_id, new.description, new.ingredients);
+                END
+            """,
+        },
+    },
+    'tabRecipeTrigram': {
+        'table': """
+            CREATE VIRTUAL TABLE IF NOT EXISTS tabRecipeTrigram USING fts5(
+                title, ingredients,
+                content='tabRecipe', content_rowid='id',
+                tokenize='trigram'
+            )
+        """,
+        'triggers': {
+            'tabRecipe_trigram_insert': """
+                CREATE TRIGGER IF NOT EXISTS tabRecipe_trigram_insert AFTER INSERT ON tabRecipe BEGIN
+                    INSERT INTO tabRecipeTrigram(rowid, title, ingredients) VALUES (new.id, new.title, new.ingredients);
+                END
+            """,
+            'tabRecipe_trigram_delete': """
+                CREATE TRIGGER IF NOT EXISTS tabRecipe_trigram_delete AFTER DELETE ON tabRecipe BEGIN
+                    INSERT INTO tabRecipeTrigram(tabRecipeTrigram, rowid, title, ingredients)
+                    VALUES ('delete', old.id, old.title, old.ingredients);
+                END
+            """,
+            'tabRecipe_trigram_update': """
+                CREATE TRIGGER IF NOT EXISTS tabRecipe_trigram_update AFTER UPDATE OF title, ingredients ON tabRecipe BEGIN
+                    INSERT INTO tabRecipeTrigram(tabRecipeTrigram, rowid, title, ingredients)
+                    VALUES ('delete', old.id, old.title, old.ingredients);
+                    INSERT INTO tabRecipeTrigram(rowid, title, ingredients) VALUES (new.id, new.title, new.ingredients);
+                END
+            """,
+        },
+    },
+}
+
+
+def search_index_sql(table):
+    """
+        The statements creating the index ``table`` and its triggers, then
+        indexing every recipe.
+    """
+    index = SEARCH_INDEXES[table]
+    return [index['table'], *index['triggers'].values(), f"INSERT INTO {table}({table}) VALUES ('rebuild')"]
+
+
+def drop_search_index_sql(table):
+    return [f"DROP TRIGGER IF EXISTS {name}" for name in SEARCH_INDEXES[table]['triggers']] + [
+        f"DROP TABLE IF EXISTS {table}"
+    ]
+
+
+def rebuild_search_index():
+    """
+        (Re)create the full-text and trigram indexes and their triggers, then reindex every recipe.
+    """
+    with connection.cursor() as cursor:
+        for table in SEARCH_INDEXES:
+            for statement in search_index_sql(table):
+                cursor.execute(statement)
+
+
+def ensure_search_triggers(using=DEFAULT_DB_ALIAS):
+    """
+        Recreate the missing sync triggers of the indexes that exist, and
+        reindex those indexes, which missed the writes made without them.
+
+        Returns the names of the recreated triggers.
+    """
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return []
+    with db.cursor() as cursor:
+        cursor.execute("SELECT type, name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        existing = set(cursor.fetchall())
+        recreated = []
+        for table, index in SEARCH_INDEXES.items():
+            missing = [name for name in index['triggers'] if ('trigger', name) not in existing]
+            if ('table', table) not in existing or not missing:
+                continue
+            for name in missing:
+                cursor.execute(index['triggers'][name])
+            cursor.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+            recreated += missing
+    return recreated
+
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def build_match_query(query):
+    """
+        Turn free text into an FTS5 MATCH expression.
+
+        Every word becomes a quoted phrase, so user input can never be read as
+        FTS5 syntax, and all words have to match. Returns None when the text
+        has no searchable words.
+    """
+    tokens = TOKEN_RE.findall(query)
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"' for token in tokens)
+
+
+def search_recipes(query):
+    """
+        Recipes matching ``query``, best BM25 score first, as a LazyRawQuery.
+    """
+    match = build_match_query(query)
+    if match is None:
+        return []
+    weights = ", ".join(str(weight) for weight in SEARCH_COLUMN_WEIGHTS)
+    sql = f"""
+        SELECT trc.*, bm25(tabRecipeSearch, {weights}) AS score
+        FROM tabRecipeSearch
+        JOIN tabRecipe AS trc ON trc.id = tabRecipeSearch.rowid
+        WHERE tabRecipeSearch MATCH %s
+    """
+    return LazyRawQuery(sql, [match], order_by='score, trc.id')
+
+
+def trigrams(word):
+    """
+        Trigrams of a word padded like pg_trgm does, so that word boundaries count.
+    """
+    padded = f"  {word.lower()} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a, b):
+    """
+        Jaccard similarity of two trigram sets, between 0 and 1.
+    """
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def fuzzy_search_recipes(query):
+    """
+        Typo tolerant search over recipe titles and ingredients.
+
+        Candidates are the recipes sharing the most trigrams with the query
+        words, found through the tabRecipeTrigram index (at most
+        ``RECIPE_FUZZY_CANDIDATES`` of them). Only those are scored: for each
+        query word the closest title/ingredient word is found, and the
+        recipe's similarity is the average over the query words. Returns the
+        recipes above ``RECIPE_FUZZY_MIN_SIMILARITY``, most similar first.
+    """
+    words = [token.lower() for token in TOKEN_RE.findall(query) if len(token) >= 3]
+    if not words:
+        return []
+    grams = sorted({word[i:i + 3] for word in words for i in range(len(word) - 2)})
+    match = " OR ".join(f'"{gram}"' for gram in grams)
+
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT trc.*
+            FROM tabRecipeTrigram
+            JOIN tabRecipe AS trc ON trc.id = tabRecipeTrigram.rowid
+            WHERE tabRecipeTrigram MATCH %s
+            ORDER BY bm25(tabRecipeTrigram)
+            LIMIT %s
+        """, [match, getattr(settings, 'RECIPE_FUZZY_CANDIDATES', 200)])
+        candidates = dictfetchall(cursor)
+
+    query_grams = [trigrams(word) for word in words]
+    min_similarity = getattr(settings, 'RECIPE_FUZZY_MIN_SIMILARITY', 0.3)
+    results = []
+    for recipe in candidates:
+        term_grams = [trigrams(term) for term in set(TOKEN_RE.findall(f"{recipe['title']} {recipe['ingredients']}"))]
+        score = sum(
+            max((similarity(grams, term) for term in term_grams), default=0.0) for grams in query_grams
+        ) / len(query_grams)
+        if score >= min_similarity:
+            recipe['similarity'] = round(score, 4)
+            results.append(recipe)
+    results.sort(key=lambda recipe: (-recipe['similarity'], recipe['id']))
+    return results
@@ -1,7 +1,10 @@
 # myapp/serializers.py
 from rest_framework import serializers
 from recipes.models import User, Category, Recipe, Review
+from django.conf import settings
+from django.contrib.auth.hashers import identify_hasher
 from django.db import models
+from .hashing import hash_password
 from .validators import validate_rating, validate_field_and_value
 
 class UserSerializer(serializers.ModelSerializer):
@@ -16,18 +19,40 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ('password', 'email', "first_name", "last_name", "phone_number")
 
     def create(self, validated_data):
-        
-        user = User.objects.create_user(
-            password=validated_data['password'],
+        # Hashed on the password hashing pool, not on the request thread
+        user = User.objects.build_user(
+            password=hash_password(validated_data['password']),
             email=validated_data['email'],
             first_name=validated_data['first_name'],
             last_name=validated_data['last_name'],
             phone_number=validated_data['phone_number']
         )
-        
-            
+        user.save()
         return user
 
+class HashedUserSerializer(serializers.ModelSerializer):
+    """
+        One user of a bulk load, with a password already hashed by a Django hasher.
+
+        Uniqueness is left to recipes.ingest, which checks a whole batch at once.
+    """
+    password = serializers.CharField()
+    email = serializers.EmailField()
+    first_name = serializers.CharField(max_length=30)
+    last_name = serializers.CharField(max_length=30)
+    phone_number = serializers.CharField(max_length=15)
+
+    class Meta:
+        model = User
+        fields = ('password', 'email', "first_name", "last_name", "phone_number")
+
+    def validate_password(self, value):
+        try:
+            identify_hasher(value)
+        except ValueError:
+            raise serializers.ValidationError("Must be a password hash, e.g. from make_password().")
+        return value
+
 class UserLoginSerializer(serializers.ModelSerializer):
     email = serializers.EmailField()
     password = serializers.CharField(write_only=True)
@@ -35,7 +60,24 @@ class UserLoginSerializer(serializers.ModelSerializer):
         model = User
         fields = ('email', 'password')
 
-class RecipeSerializer(serializers.Serializer):
+class DynamicFieldsMixin:
+    """
+        Accepts an extra ``fields`` argument that limits the fields being serialized.
+    """
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+
+# Recipe fields a client can project with ``?fields=``, all of them tabRecipe columns
+RECIPE_PROJECTION_FIELDS = ('id', 'title', 'category_id', 'avg_rating', 'cooking_time', 'serving_size',
+                            'description', 'ingredients', 'preparation_steps')
+
+
+class RecipeSerializer(DynamicFieldsMixin, serializers.Serializer):
     user = serializers.HiddenField(default=serializers.CurrentUserDefault())
     id = serializers.IntegerField(read_only=True)
     avg_rating = serializers.FloatField(read_only=True)
@@ -70,16 +112,35 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'category_id', 'avg_rating', 'user', 'title', 'description', 'ingredients', 'preparation_steps', 'cooking_time', 'serving_size')
 
 
+class ImportRecipeSerializer(CreateRecipeSerializer):
+    """
+        CreateRecipeSerializer for one row of a bulk import, without per-row queries.
+
+        The category is checked against the ``categories`` set passed in the
+        context, and title conflicts are found for a whole chunk by recipes.ingest.
+    """
+    category_id = serializers.CharField(max_length=50)
+
+    class Meta(CreateRecipeSerializer.Meta):
+        fields = ('category_id', 'title', 'description', 'ingredients', 'preparation_steps', 'cooking_time', 'serving_size')
+
+    def validate_category_id(self, value):
+        if value not in self.context['categories']:
+            raise serializers.ValidationError(f'Invalid pk "{value}" - object does not exist.')
+        return value
+
+
 class FilterValueField(serializers.Field):
     def to_internal_value(self, data):
         if isinstance(data, list):
             return data
         try:
             return int(data)
-        except ValueError:
+        except (TypeError, ValueError):
             try:
                 return float(data)
-            except ValueError:
+            except (TypeError, ValueError):
+                # Left to recipes.filters, which rejects what is not a scalar
                 return data
 
 class FilterSerializer(serializers.Serializer):
@@ -103,7 +164,7 @@ class ListRequestRecipeSerializer(serializers.Serializer):
 
 
 
-class UpdateRecipeSerializer(serializers.ModelSerializer):
+class UpdateRecipeSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     user_id = serializers.HiddenField(default=serializers.CurrentUserDefault())
     id = serializers.IntegerField(read_only=True)
     title = serializers.CharField(max_length=100, required=False)
@@ -122,7 +183,7 @@ class CreateRecipeSerializer2(serializers.ModelSerializer):
     class Meta:
         model = Recipe
         fields = '__all__'
-        read_only_fields = ['user_id', 'created_at', 'updated_at']
+        read_only_fields = ['user_id', 'created_at', 'updated_at', 'rating_sum', 'review_count', 'avg_rating']
         
         
 class ReviewSerializer(serializers.ModelSerializer):
@@ -136,6 +197,25 @@ class ReviewSerializer(serializers.ModelSerializer):
         model = Review
         fields = ('id', 'user', 'recipe', 'rating', 'comment')
 
+class BatchReviewItemSerializer(serializers.Serializer):
+    # The recipe is checked for all the items of a batch at once, see recipes.ingest
+    recipe = serializers.IntegerField()
+    rating = serializers.IntegerField(validators=[validate_rating])
+    comment = serializers.CharField()
+
+
+class BatchReviewSerializer(serializers.Serializer):
+    # Any item is accepted here, BatchReviewItemSerializer rejects the ones
+    # that are not an object along with the other invalid items
+    reviews = serializers.ListField(child=serializers.JSONField(), allow_empty=False)
+
+    def validate_reviews(self, value):
+        max_size = settings.REVIEW_BATCH_MAX_SIZE
+        if len(value) > max_size:
+            raise serializers.ValidationError(f"A batch holds at most {max_size} reviews.")
+        return value
+
+
 class UpdateReviewSerializer(serializers.ModelSerializer):
     user = serializers.HiddenField(default=serializers.CurrentUserDefault())
     recipe = serializers.PrimaryKeyRelatedField(queryset=Recipe.objects.all(), required=False)
@@ -0,0 +1,139 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, post_delete, post_migrate
+from django.dispatch import receiver
+from .authentication import user_cache
+from .autocomplete import prefix_index
+from .detail_cache import invalidate_recipe_detail
+from .models import CatalogueCounter, Recipe, Review, User
+from .search import ensure_search_triggers
+from .utils import bump_catalogue_generation
+
+
+@receiver(pre_save, sender=Review)
+def remember_previous_rating(sender, instance, **kwargs):
+    # The post_save handler needs the old values to work out the delta. The
+    # row stays locked until Review.save() commits, so a concurrent edit of
+    # the same review waits and reads the rating this one writes.
+    instance._previous_rating = None
+    if instance.pk:
+        instance._previous_rating = (
+            Review.objects.select_for_update().filter(pk=instance.pk).values_list('recipe_id', 'rating').first()
+        )
+
+
+@receiver(post_save, sender=Review)
+def update_rating_aggregates_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_rating', None)
+    if created or previous is None:
+        Recipe.objects.apply_rating_delta(instance.recipe_id, instance.rating, 1)
+        return
+
+    previous_recipe_id, previous_rating = previous
+    if previous_recipe_id == instance.recipe_id:
+        # Applied even for a zero delta, it also marks the recipe as updated
+        Recipe.objects.apply_rating_delta(instance.recipe_id, instance.rating - previous_rating, 0)
+    else:
+        Recipe.objects.apply_rating_delta(previous_recipe_id, -previous_rating, -1)
+        Recipe.objects.apply_rating_delta(instance.recipe_id, instance.rating, 1)
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_aggregates_on_delete(sender, instance, **kwargs):
+    Recipe.objects.apply_rating_delta(instance.recipe_id, -instance.rating, -1)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_catalogue_caches(sender, **kwargs):
+    # After commit, so a concurrent reader cannot cache pre-commit data
+    # under the new generation.
+    transaction.on_commit(bump_catalogue_generation)
+
+
+@receiver(post_delete, sender=Recipe)
+def count_recipe_delete(sender, instance, **kwargs):
+    # In the deleting transaction, the recipe list's ETag reads it from the
+    # database and must never see the delete without it
+    CatalogueCounter.objects.bump(CatalogueCounter.RECIPE_DELETES)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe_detail_cache(sender, instance, **kwargs):
+    recipe_id = instance.id
+    transaction.on_commit(lambda: invalidate_recipe_detail(recipe_id))
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_reviewed_recipe_detail_cache(sender, instance, **kwargs):
+    # A review moved to another recipe changes the detail of both
+    previous = getattr(instance, '_previous_rating', None)
+    recipe_ids = (instance.recipe_id, previous[0] if previous else None)
+    transaction.on_commit(lambda: invalidate_recipe_detail(*recipe_ids))
+
+
+@receiver(post_save, sender=Recipe)
+def update_prefix_index(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(lambda: prefix_index.update_recipe(instance))
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_from_prefix_index(sender, instance, **kwargs):
+    recipe_id = instance.id
+    transaction.on_commit(lambda: prefix_index.remove_recipe(recipe_id))
+
+
+@receiver(post_save, sender=Review)
+def update_prefix_index_popularity_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_rating', None)
+    if created or previous is None:
+        transaction.on_commit(lambda: prefix_index.add_reviews(instance.recipe_id, 1))
+    elif previous[0] != instance.recipe_id:
+        transaction.on_commit(lambda: prefix_index.add_reviews(previous[0], -1))
+        transaction.on_commit(lambda: prefix_index.add_reviews(instance.recipe_id, 1))
+
+
+@receiver(post_delete, sender=Review)
+def update_prefix_index_popularity_on_delete(sender, instance, **kwargs):
+    recipe_id = instance.recipe_id
+    transaction.on_commit(lambda: prefix_index.add_reviews(recipe_id, -1))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # Dropped at once and again after commit, a request in between could
+    # otherwise cache the row as it was before the transaction
+    user_cache.invalidate(instance.pk)
+    transaction.on_commit(lambda: user_cache.invalidate(instance.pk))
+
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, using, verbosity=1, **kwargs):
+    # A migration that rebuilds tabRecipe (most AlterFields on SQLite) drops
+    # the triggers keeping the search indexes in sync, without any error
+    if sender.name != 'recipes':
+        return
+    recreated = ensure_search_triggers(using)
+    if recreated and verbosity:
+        print(f"Recreated search index triggers: {', '.join(recreated)}")
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    # Most PRAGMAs only last as long as the connection, see SQLITE_PRAGMA_PROFILES
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
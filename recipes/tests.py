@@ -1,3 +1,938 @@
-from django.test import TestCase
+import contextlib
+import csv
+import importlib.util
+import io
+import json
+import logging
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.auth.signals import user_logged_in, user_login_failed
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.management.sql import emit_post_migrate_signal
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from django.db.models import QuerySet
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+from recipehub.log import BackgroundFileHandler, JsonFormatter, RequestIdFilter
+from recipehub.profiling import list_profiles
+
+from .authentication import CachedJWTAuthentication, user_cache
+from .autocomplete import PrefixIndex, TOP_MIN_RANGE
+from .detail_cache import detail_cache, detail_cache_stats
+from .filters import compile_filters, compile_shape
+from .models import Category, Recipe, Review, User
+from .pagination import KeysetPagination, RECIPE_ORDERING_FIELDS, encode_cursor, order_by_sql
+from .search import (SEARCH_INDEXES, drop_search_index_sql, ensure_search_triggers, fuzzy_search_recipes,
+                     search_recipes)
+from .utils import LazyRawQuery
 
 # Create your tests here.
+
+
+class RecipeOrderingQueryPlanTest(TestCase):
+    """
+        Every supported ordering of the recipe list must be served by an index,
+        never by sorting the whole table in a temporary B-tree.
+    """
+    query = "SELECT trc.* FROM tabRecipe AS trc"
+
+    def orderings(self):
+        for field in RECIPE_ORDERING_FIELDS:
+            yield field
+            yield f"-{field}"
+
+    def query_plan(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            return " | ".join(row[-1] for row in cursor.fetchall())
+
+    def assertNoSort(self, sql, params):
+        plan = self.query_plan(sql, params)
+        self.assertNotIn("TEMP B-TREE", plan, msg=f"{sql}\n{plan}")
+
+    def test_page_number_ordering_uses_index(self):
+        for ordering in self.orderings():
+            with self.subTest(ordering=ordering):
+                page = LazyRawQuery(self.query, order_by=order_by_sql(ordering))
+                self.assertNoSort(*page.get_page_sql(10, 20))
+
+    def test_keyset_ordering_uses_index(self):
+        cursor_values = {
+            'avg_rating': 3.5, 'cooking_time': 30, 'serving_size': 2,
+            'created_at': '2024-05-30 10:23:00', 'title': 'Soup',
+        }
+        for ordering in self.orderings():
+            value = cursor_values[ordering.lstrip('-')]
+            for cursor in (None, (value, 10, False), (value, 10, True)):
+                with self.subTest(ordering=ordering, cursor=cursor):
+                    self.assertNoSort(*KeysetPagination.get_page_sql(self.query, [], ordering, cursor, 10))
+
+
+class RecipeAPITestCase(TestCase):
+    """
+        A user with an authenticated client, two categories and a few recipes,
+        with empty caches.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='cook@example.com', password='pw', first_name='Ada',
+                                            last_name='Cook', phone_number='555-0100')
+        Category.objects.create(name='Soup')
+        Category.objects.create(name='Cake')
+        cls.recipes = [
+            Recipe.objects.create(user=cls.user, title=f'Recipe {i}', description='d', ingredients='salt, flour',
+                                  preparation_steps='p', cooking_time=10 + (i % 4) * 5, serving_size=2,
+                                  category_id='Soup' if i % 2 else 'Cake')
+            for i in range(12)
+        ]
+
+    def setUp(self):
+        caches['default'].clear()
+        detail_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_review(self, recipe, rating):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/reviews', {'recipe': recipe.id, 'rating': rating, 'comment': 'ok'},
+                                        format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()['data']['id']
+
+    def assertAggregates(self, recipe, rating_sum, review_count):
+        recipe.refresh_from_db()
+        self.assertEqual((recipe.rating_sum, recipe.review_count), (rating_sum, review_count))
+        self.assertAlmostEqual(recipe.avg_rating, rating_sum / review_count if review_count else 0)
+
+
+class RatingAggregateTest(RecipeAPITestCase):
+    """
+        rating_sum, review_count and avg_rating follow every review write.
+    """
+
+    def test_create_update_move_delete(self):
+        first, second = self.recipes[0], self.recipes[1]
+        review_id = self.add_review(first, 4)
+        self.add_review(first, 1)
+        self.assertAggregates(first, 5, 2)
+
+        self.client.put(f'/api/reviews/{review_id}', {'rating': 2}, format='json')
+        self.assertAggregates(first, 3, 2)
+
+        self.client.put(f'/api/reviews/{review_id}', {'recipe': second.id, 'rating': 3}, format='json')
+        self.assertAggregates(first, 1, 1)
+        self.assertAggregates(second, 3, 1)
+
+        self.client.delete(f'/api/reviews/{review_id}')
+        self.assertAggregates(second, 0, 0)
+        call_command('rebuild_rating_aggregates', verify=True, stdout=io.StringIO())
+
+    def test_batch(self):
+        first, second = self.recipes[0], self.recipes[1]
+        response = self.client.post('/api/reviews/batch', {'reviews': [
+            {'recipe': first.id, 'rating': 5, 'comment': 'a'},
+            {'recipe': second.id, 'rating': 9, 'comment': 'out of range'},
+            {'recipe': first.id, 'rating': 2, 'comment': 'b'},
+            {'recipe': second.id, 'rating': 4, 'comment': 'c'},
+            'not a review',
+            7,
+        ]}, format='json')
+        self.assertEqual(response.status_code, 207)
+        data = response.json()['data']
+        self.assertEqual(data['created'], 3)
+        self.assertEqual([error['index'] for error in data['errors']], [1, 4, 5])
+        self.assertIn('non_field_errors', data['errors'][1]['errors'])
+        self.assertAggregates(first, 7, 2)
+        self.assertAggregates(second, 4, 1)
+        self.assertEqual(Recipe.objects.rating_aggregate_mismatches(), [])
+
+    def test_recipe_save_keeps_aggregates(self):
+        recipe = self.recipes[0]
+        loaded = Recipe.objects.get(pk=recipe.pk)
+        self.add_review(recipe, 4)
+        loaded.title = 'Saved while stale'
+        loaded.save()
+        self.assertAggregates(recipe, 4, 1)
+        self.assertEqual(recipe.title, 'Saved while stale')
+
+        response = self.client.put(f'/api/recipe/{recipe.id}', {'title': 'Renamed'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertAggregates(recipe, 4, 1)
+
+    def test_verify_and_rebuild(self):
+        recipe = self.recipes[0]
+        self.add_review(recipe, 4)
+        Recipe.objects.filter(pk=recipe.pk).update(rating_sum=99)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_rating_aggregates', verify=True, stdout=io.StringIO())
+        call_command('rebuild_rating_aggregates', stdout=io.StringIO())
+        call_command('rebuild_rating_aggregates', verify=True, stdout=io.StringIO())
+        self.assertAggregates(recipe, 4, 1)
+
+
+class FilterCompilerTest(RecipeAPITestCase):
+    """
+        /recipes filters compile to parameterized SQL, memoized per shape.
+    """
+
+    def list_titles(self, filters):
+        response = self.client.post('/api/recipes?page_size=100', {'filters': filters}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return sorted(recipe['title'] for recipe in response.json()['data']['results'])
+
+    def test_values_are_bound(self):
+        Recipe.objects.create(user=self.user, title="Mom's soup", description='d', ingredients='i',
+                              preparation_steps='p', cooking_time=5, serving_size=1, category_id='Soup')
+        where_sql, params = compile_filters([{'field': 'title', 'operator': '=', 'value': "Mom's soup"}])
+        self.assertEqual((where_sql, params), ("trc.title = %s", ["Mom's soup"]))
+        self.assertEqual(self.list_titles([{'field': 'title', 'operator': '=', 'value': "Mom's soup"}]), ["Mom's soup"])
+        self.assertEqual(self.list_titles([{'field': 'title', 'operator': '=', 'value': "x' OR '1'='1"}]), [])
+
+    def test_like_escapes_wildcards(self):
+        for title in ('100% rye', '1000 rye', 'a_b cake', 'axb cake'):
+            Recipe.objects.create(user=self.user, title=title, description='d', ingredients='i',
+                                  preparation_steps='p', cooking_time=5, serving_size=1, category_id='Cake')
+        self.assertEqual(compile_filters([{'field': 'title', 'operator': 'like', 'value': '100%'}])[1], ['%100\\%%'])
+        self.assertEqual(self.list_titles([{'field': 'title', 'operator': 'like', 'value': '100%'}]), ['100% rye'])
+        self.assertEqual(self.list_titles([{'field': 'title', 'operator': 'like', 'value': 'a_b'}]), ['a_b cake'])
+
+    def test_shape_cache(self):
+        compile_shape.cache_clear()
+        first = compile_filters([{'field': 'category_id', 'operator': 'in', 'value': ['Soup', 'Cake']},
+                                 {'field': 'cooking_time', 'operator': '!=', 'value': 15}])
+        # Same shape, other values and order
+        second = compile_filters([{'field': 'cooking_time', 'operator': '!=', 'value': 20},
+                                  {'field': 'category_id', 'operator': 'in', 'value': ['Cake', 'Soup']}])
+        self.assertEqual(first[0], second[0])
+        self.assertEqual((first[1], second[1]), (['Soup', 'Cake', 15], ['Cake', 'Soup', 20]))
+        info = compile_shape.cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 1))
+
+    def test_operator_arity(self):
+        for operator, value in (('=', ['a']), ('like', ['a']), ('in', 'Soup'), ('not in', [['Soup']]), ('=', {'a': 1})):
+            with self.subTest(operator=operator, value=value):
+                with self.assertRaises(ValidationError):
+                    compile_filters([{'field': 'category_id', 'operator': operator, 'value': value}])
+                response = self.client.post('/api/recipes', {'filters': [
+                    {'field': 'category_id', 'operator': operator, 'value': value},
+                ]}, format='json')
+                self.assertEqual(response.status_code, 400)
+
+
+class FacetTest(RecipeAPITestCase):
+    """
+        /recipes/facets counts the recipes the filters select, and follows
+        the review writes.
+    """
+
+    def facets(self, filters):
+        response = self.client.post('/api/recipes/facets', {'filters': filters}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['data']
+
+    def test_filters(self):
+        facets = self.facets([{'field': 'category_id', 'operator': '=', 'value': 'Soup'}])
+        self.assertEqual((facets['total'], facets['category']), (6, {'Soup': 6}))
+        self.assertEqual(facets['cooking_time'], {'0-15': 0, '15-30': 6, '30-60': 0, '60+': 0})
+        self.assertEqual(facets['rating']['0-1'], 6)
+
+        facets = self.facets([{'field': 'cooking_time', 'operator': 'in', 'value': [10]}])
+        self.assertEqual((facets['total'], facets['category']), (3, {'Cake': 3}))
+        self.assertEqual(facets['cooking_time']['0-15'], 3)
+        self.assertEqual(self.facets([])['total'], 12)
+
+    def test_follows_reviews(self):
+        soup = [{'field': 'category_id', 'operator': '=', 'value': 'Soup'}]
+        self.facets(soup)
+        self.add_review(self.recipes[1], 5)
+        self.assertEqual(self.facets(soup)['rating'], {'0-1': 5, '1-2': 0, '2-3': 0, '3-4': 0, '4-5': 1})
+
+
+@override_settings(RECIPE_EXPORT_CHUNK_SIZE=5)
+class ExportTest(RecipeAPITestCase):
+    """
+        Every format of the export reads back as the recipes it was made
+        from, across chunks.
+    """
+
+    def setUp(self):
+        super().setUp()
+        Recipe.objects.create(user=self.user, title='Salt, "pepper"', description='line one\nline two',
+                              ingredients='i', preparation_steps='p', cooking_time=5, serving_size=1,
+                              category_id='Soup')
+        self.add_review(self.recipes[0], 4)
+
+    def assertRoundTrip(self, rows):
+        expected = list(Recipe.objects.order_by('id').values_list('id', 'title', 'description', 'review_count',
+                                                                 'avg_rating'))
+        self.assertEqual([(int(row['id']), row['title'], row['description'], int(row['review_count']),
+                           float(row['avg_rating'])) for row in rows], expected)
+
+    def export(self, file_format):
+        response = self.client.get(f'/api/recipes/export?file_format={file_format}')
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson(self):
+        self.assertRoundTrip([json.loads(line) for line in self.export('ndjson').splitlines()])
+
+    def test_csv(self):
+        self.assertRoundTrip(list(csv.DictReader(io.StringIO(self.export('csv'), newline=''))))
+
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'), "needs pyarrow")
+    def test_parquet(self):
+        import pyarrow.parquet as pq
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'recipes.parquet')
+            call_command('export_recipes', format='parquet', output=path, stderr=io.StringIO())
+            parquet = pq.ParquetFile(path)
+            self.assertEqual(parquet.metadata.num_row_groups, 3)
+            self.assertRoundTrip(parquet.read().to_pylist())
+
+
+@override_settings(RECIPE_IMPORT_CHUNK_SIZE=2)
+class ImportTest(RecipeAPITestCase):
+    """
+        An import creates the valid rows and reports the others by line.
+    """
+
+    def row(self, title, **fields):
+        return {'title': title, 'category_id': 'Soup', 'description': 'd', 'ingredients': 'i',
+                'preparation_steps': 'p', 'cooking_time': 5, 'serving_size': 1, **fields}
+
+    def upload(self, content, file_format='ndjson'):
+        response = self.client.post(f'/api/recipes/import?file_format={file_format}',
+                                    {'file': SimpleUploadedFile(f'recipes.{file_format}', content.encode())},
+                                    format='multipart')
+        return response.status_code, response.json()['data']
+
+    def test_partial_success(self):
+        lines = [
+            json.dumps(self.row('Imported A')),
+            'oops',
+            '',
+            json.dumps(self.row('Imported C', category_id='Bread')),
+            json.dumps(self.row('Recipe 0')),
+            json.dumps(self.row('Imported B')),
+            json.dumps(self.row('Imported B')),
+            '[1]',
+        ]
+        status_code, data = self.upload("\n".join(lines))
+        self.assertEqual((status_code, data['created']), (207, 2))
+        self.assertEqual([(error['line'], *error['errors']) for error in data['errors']], [
+            (2, 'non_field_errors'), (4, 'category_id'), (5, 'title'), (7, 'title'), (8, 'non_field_errors'),
+        ])
+        self.assertEqual(Recipe.objects.filter(title__startswith='Imported').count(), 2)
+
+    def test_csv(self):
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=list(self.row('')))
+        writer.writeheader()
+        writer.writerow(self.row('Imported A'))
+        writer.writerow(self.row('Imported B', cooking_time='soon'))
+        status_code, data = self.upload(buffer.getvalue(), 'csv')
+        self.assertEqual((status_code, data['created']), (207, 1))
+        self.assertEqual([(error['line'], *error['errors']) for error in data['errors']], [(3, 'cooking_time')])
+
+    def test_nothing_imported(self):
+        status_code, data = self.upload(json.dumps(self.row('Recipe 1')))
+        self.assertEqual((status_code, data['created']), (400, 0))
+        self.assertEqual(data['errors'][0]['line'], 1)
+
+
+class KeysetTraversalTest(RecipeAPITestCase):
+    """
+        Following next links, then previous links back, visits every recipe
+        once in order, ties on the sort key included.
+    """
+
+    def traverse(self, url, direction):
+        ids, pages = [], []
+        while url:
+            data = self.client.post(url, {}, format='json').json()['data']
+            pages.append(url)
+            page_ids = [recipe['id'] for recipe in data['results']]
+            ids = ids + page_ids if direction == 'next' else page_ids + ids
+            url = data[direction]
+        return ids, pages
+
+    def test_both_directions(self):
+        for ordering, expected in (
+            ('cooking_time', Recipe.objects.order_by('cooking_time', 'id')),
+            ('-cooking_time', Recipe.objects.order_by('-cooking_time', '-id')),
+            ('-created_at', Recipe.objects.order_by('-created_at', '-id')),
+        ):
+            with self.subTest(ordering=ordering):
+                expected = list(expected.values_list('id', flat=True))
+                forward, pages = self.traverse(f'/api/recipes?pagination=cursor&page_size=5&ordering={ordering}', 'next')
+                self.assertEqual(forward, expected)
+                last_page = self.client.post(pages[-1], {}, format='json').json()['data']
+                backward, _ = self.traverse(last_page['previous'], 'previous')
+                self.assertEqual(backward + [recipe['id'] for recipe in last_page['results']], expected)
+
+    def test_tampered_cursor(self):
+        for payload in ({'o': '-created_at', 'v': [1, 2], 'id': 1, 'r': 0}, {'o': '-created_at', 'v': 'x', 'id': 'y', 'r': 0},
+                        {'o': 'title', 'v': 'x', 'id': 1, 'r': 0}):
+            with self.subTest(payload=payload):
+                url = f'/api/recipes?pagination=cursor&cursor={encode_cursor(payload)}'
+                self.assertEqual(self.client.post(url, {}, format='json').status_code, 404)
+        self.assertEqual(self.client.post('/api/recipes?pagination=cursor&cursor=zzz', {}, format='json').status_code, 404)
+
+
+class ConditionalRequestTest(RecipeAPITestCase):
+    """
+        Recipe detail and list answer matching validators with 304, and stop
+        once the data they were derived from changes.
+    """
+
+    def test_detail(self):
+        recipe = self.recipes[0]
+        response = self.client.get(f'/api/recipe/{recipe.id}')
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(self.client.get(f'/api/recipe/{recipe.id}', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(f'/api/recipe/{recipe.id}', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        # Another representation of the same recipe
+        self.assertEqual(self.client.get(f'/api/recipe/{recipe.id}?fields=title', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        self.add_review(recipe, 5)
+        self.assertEqual(self.client.get(f'/api/recipe/{recipe.id}', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list(self):
+        response = self.client.post('/api/recipes?page_size=5', {}, format='json')
+        etag = response['ETag']
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertEqual(self.client.post('/api/recipes?page_size=5', {}, format='json', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.post('/api/recipes?page_size=6', {}, format='json', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.post('/api/recipes?page_size=5', {}, format='json',
+                                          HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT').status_code, 200)
+
+        # A delete changes no updated_at. Its on-commit callbacks are not run,
+        # as for a delete made through another worker: this worker's catalogue
+        # generation stays the same, the delete counter in the database moves.
+        deleted_id = self.recipes[0].id
+        self.recipes[0].delete()
+        response = self.client.post('/api/recipes?page_size=5', {}, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(deleted_id, [recipe['id'] for recipe in response.json()['data']['results']])
+
+
+class DetailCacheInvalidationTest(RecipeAPITestCase):
+    """
+        Cached recipe detail bodies are dropped by every write they depend on.
+    """
+
+    def get_detail(self, recipe):
+        response = self.client.get(f'/api/recipe/{recipe.id}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['data']
+
+    def test_hit(self):
+        recipe = self.recipes[0]
+        detail_cache_stats.reset()
+        first = self.client.get(f'/api/recipe/{recipe.id}')
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(f'/api/recipe/{recipe.id}')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual((detail_cache_stats.hits, detail_cache_stats.misses), (1, 1))
+        # Only the validators are read on a hit
+        self.assertEqual(len(queries), 1)
+
+    def test_writes_invalidate(self):
+        recipe = self.recipes[0]
+        review_id = self.add_review(recipe, 3)
+        self.get_detail(recipe)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(f'/api/reviews/{review_id}', {'comment': 'edited'}, format='json')
+        self.assertEqual(self.get_detail(recipe)['reviews'][0]['comment'], 'edited')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(f'/api/recipe/{recipe.id}', {'title': 'Renamed'}, format='json')
+        self.assertEqual(self.get_detail(recipe)['recipe']['title'], 'Renamed')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/reviews/{review_id}')
+        detail = self.get_detail(recipe)
+        self.assertEqual((detail['reviews'], detail['rating']['review_count']), ([], 0))
+
+
+class ReviewPageTest(RecipeAPITestCase):
+    """
+        The reviews embedded in a recipe detail come in pages of a clamped
+        size, newest first.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.recipes[0]
+        Review.objects.bulk_create(
+            Review(user=self.user, recipe=self.recipe, rating=i % 5 + 1, comment=f'review {i}') for i in range(105)
+        )
+
+    def detail(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['data']
+
+    def test_page_size_is_clamped(self):
+        for page_size, expected in (('1000', 100), ('0', 1), ('-5', 1), ('abc', 10), ('25', 25)):
+            with self.subTest(page_size=page_size):
+                data = self.detail(f'/api/recipe/{self.recipe.id}?reviews_page_size={page_size}')
+                self.assertEqual(len(data['reviews']), expected)
+                self.assertIsNotNone(data['reviews_next'])
+
+    def test_traversal(self):
+        url, ids = f'/api/recipe/{self.recipe.id}?reviews_page_size=40', []
+        while url:
+            data = self.detail(url)
+            ids += [review['id'] for review in data['reviews']]
+            url = data['reviews_next']
+        expected = Review.objects.filter(recipe=self.recipe).order_by('-created_at', '-id').values_list('id', flat=True)
+        self.assertEqual(ids, list(expected))
+        self.assertEqual(data['rating']['histogram'], {'0': 0, '1': 21, '2': 21, '3': 21, '4': 21, '5': 21})
+
+
+class PrefixIndexTest(RecipeAPITestCase):
+    """
+        Completions rank terms by the popularity of their recipes and follow
+        recipe and review changes, with and without the cached best keys of
+        large ranges.
+    """
+
+    def setUp(self):
+        super().setUp()
+        Recipe.objects.filter(pk=self.recipes[3].pk).update(review_count=2)
+        Recipe.objects.filter(pk=self.recipes[5].pk).update(review_count=1)
+        self.index = PrefixIndex()
+
+    def terms(self, prefix, limit=3):
+        return [completion['term'] for completion in self.index.complete(prefix, limit)]
+
+    def test_ranking(self):
+        self.assertEqual(self.terms('recipe'), ['Recipe 3', 'Recipe 5', 'Recipe 0'])
+        self.assertEqual(self.index.complete('sa', 1), [{'term': 'salt', 'kind': 'ingredient', 'score': 15}])
+        # Soup is recipes 1, 3, 5, ...: six recipes, three reviews
+        self.assertEqual(self.index.complete('SOU', 1), [{'term': 'Soup', 'kind': 'category', 'score': 9}])
+        self.assertEqual(self.terms('zz'), [])
+
+    def test_updates_and_removal(self):
+        for top_min_range in (0, TOP_MIN_RANGE):
+            with self.subTest(top_min_range=top_min_range), mock.patch('recipes.autocomplete.TOP_MIN_RANGE', top_min_range):
+                index = self.index = PrefixIndex()
+                self.assertEqual(self.terms('r'), ['Recipe 3', 'Recipe 5', 'Recipe 0'])
+
+                index.add_reviews(self.recipes[1].id, 5)
+                self.assertEqual(self.terms('r'), ['Recipe 1', 'Recipe 3', 'Recipe 5'])
+                self.assertEqual(self.terms('recipe'), ['Recipe 1', 'Recipe 3', 'Recipe 5'])
+
+                recipe = Recipe(id=self.recipes[1].id, title='Zucchini bake', category_id='Cake', ingredients='flour')
+                index.update_recipe(recipe)
+                self.assertEqual(self.terms('r'), ['Recipe 3', 'Recipe 5', 'Recipe 0'])
+                self.assertEqual(self.index.complete('zu', 1), [{'term': 'Zucchini bake', 'kind': 'title', 'score': 6}])
+                self.assertEqual(self.index.complete('salt', 1)[0]['score'], 14)
+
+                index.remove_recipe(self.recipes[3].id)
+                self.assertEqual(self.terms('r'), ['Recipe 5', 'Recipe 0', 'Recipe 10'])
+                self.assertEqual(self.index.complete('salt', 1)[0]['score'], 11)
+                index.remove_recipe(recipe.id)
+                self.assertEqual(self.terms('zu'), [])
+
+    def test_changes_during_build(self):
+        fill = PrefixIndex._fill
+        renamed, deleted = self.recipes[0], self.recipes[3]
+
+        def fill_then_write(fresh):
+            fill(fresh)
+            # Committed while the build runs, after it read tabRecipe
+            Recipe.objects.filter(pk=renamed.pk).update(title='Zucchini bake')
+            self.index.update_recipe(Recipe(id=renamed.id, title='Zucchini bake', ingredients=''))
+            deleted_id = deleted.id
+            deleted.delete()
+            self.index.remove_recipe(deleted_id)
+
+        with mock.patch.object(PrefixIndex, '_fill', autospec=True, side_effect=fill_then_write):
+            self.index.load()
+        self.assertEqual(self.terms('zu'), ['Zucchini bake'])
+        self.assertEqual(self.terms('recipe'), ['Recipe 5', 'Recipe 1', 'Recipe 10'])
+
+
+class SearchTriggerTest(RecipeAPITestCase):
+    """
+        The search index triggers dropped by a table rebuild are put back
+        after migrating, and the writes made without them are reindexed.
+    """
+
+    def search_ids(self, query):
+        return [recipe['id'] for recipe in search_recipes(query)[0:None]]
+
+    def test_restored_after_migrate(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER tabRecipe_search_insert")
+            cursor.execute("DROP TRIGGER tabRecipe_trigram_update")
+        recipe = Recipe.objects.create(user=self.user, title='Quince jelly', description='d', ingredients='quince',
+                                       preparation_steps='p', cooking_time=5, serving_size=1, category_id='Cake')
+        self.assertEqual(self.search_ids('quince'), [])
+
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            emit_post_migrate_signal(verbosity=1, interactive=False, db='default')
+        self.assertIn('tabRecipe_search_insert, tabRecipe_trigram_update', stdout.getvalue())
+        self.assertEqual(self.search_ids('quince'), [recipe.id])
+        self.assertEqual(ensure_search_triggers(), [])
+
+        Recipe.objects.filter(pk=recipe.pk).update(title='Quinse jelly')
+        self.assertEqual([match['id'] for match in fuzzy_search_recipes('quinse')], [recipe.id])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            for table in SEARCH_INDEXES:
+                for statement in drop_search_index_sql(table):
+                    cursor.execute(statement)
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual(self.search_ids('Recipe 3'), [self.recipes[3].id])
+        self.assertEqual(ensure_search_triggers(), [])
+
+
+class FuzzySearchTest(RecipeAPITestCase):
+    """
+        /search falls back to typo tolerant matching when the full-text
+        search finds nothing.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.brownies = Recipe.objects.create(user=self.user, title='Chocolate brownies', description='d',
+                                              ingredients='cocoa, butter, sugar', preparation_steps='p',
+                                              cooking_time=30, serving_size=8, category_id='Cake')
+        Recipe.objects.create(user=self.user, title='Pumpkin soup', description='d', ingredients='pumpkin, cream',
+                              preparation_steps='p', cooking_time=40, serving_size=4, category_id='Soup')
+
+    def search(self, path):
+        response = self.client.get(f'/api/search/{path}')
+        return response.status_code, response.json()['data']
+
+    def test_misspelling(self):
+        status_code, data = self.search('chocolate')
+        self.assertEqual((status_code, data['fuzzy']), (200, False))
+        self.assertEqual([recipe['id'] for recipe in data['search_results']], [self.brownies.id])
+
+        for path in ('chocolte', 'brwnies coca', 'brownies?fuzzy=1'):
+            with self.subTest(path=path):
+                status_code, data = self.search(path)
+                self.assertEqual((status_code, data['fuzzy']), (200, True))
+                self.assertEqual([recipe['id'] for recipe in data['search_results']], [self.brownies.id])
+
+        self.assertEqual(self.search('xqzvw')[0], 404)
+
+
+class SQLitePragmaTest(TestCase):
+    """
+        The PRAGMAs of SQLITE_PRAGMA_PROFILE are applied to every new connection.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'db.sqlite3')
+
+    def pragmas(self, profile):
+        db = SQLiteDatabaseWrapper({**connection.settings_dict, 'NAME': self.path}, alias='pragma-test')
+        try:
+            with override_settings(SQLITE_PRAGMAS=settings.SQLITE_PRAGMA_PROFILES[profile]), db.cursor() as cursor:
+                values = {}
+                for name in ('journal_mode', 'synchronous', 'temp_store', 'cache_size'):
+                    cursor.execute(f"PRAGMA {name}")
+                    values[name] = cursor.fetchone()[0]
+                return values
+        finally:
+            db.close()
+
+    def test_profiles(self):
+        # synchronous NORMAL is 1, temp_store MEMORY is 2
+        self.assertEqual(self.pragmas('tuned'), {
+            'journal_mode': 'wal', 'synchronous': 1, 'temp_store': 2,
+            'cache_size': settings.SQLITE_PRAGMA_PROFILES['tuned']['cache_size'],
+        })
+        # WAL is kept in the database file, the default profile turns it off again
+        self.assertEqual(self.pragmas('default')['journal_mode'], 'delete')
+
+
+class MetricsAccessTest(TestCase):
+    """
+        /metrics is only served to allowed addresses or with the bearer token.
+    """
+
+    def status(self, **extra):
+        return self.client.get('/metrics', **extra).status_code
+
+    @override_settings(METRICS_ALLOWED_IPS=[], METRICS_TOKEN='')
+    def test_closed_by_default(self):
+        self.assertEqual(self.status(), 403)
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.0/8'], METRICS_TOKEN='s3cret')
+    def test_allowlist_and_token(self):
+        self.assertEqual(self.status(REMOTE_ADDR='10.1.2.3'), 200)
+        self.assertEqual(self.status(REMOTE_ADDR='192.0.2.1'), 403)
+        self.assertEqual(self.status(REMOTE_ADDR='192.0.2.1', HTTP_AUTHORIZATION='Bearer s3cret'), 200)
+        self.assertEqual(self.status(REMOTE_ADDR='192.0.2.1', HTTP_AUTHORIZATION='Bearer wrong'), 403)
+
+
+class CachedJWTAuthenticationTest(TestCase):
+    """
+        Token users come from user_cache, a copy per request, and a change
+        to the user is seen by the next request.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='cook@example.com', password='pw', first_name='Ada',
+                                            last_name='Cook', phone_number='555-0100')
+
+    def setUp(self):
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+
+    def authenticate(self, token):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return CachedJWTAuthentication().authenticate(request)[0]
+
+    def test_copy_per_request(self):
+        token = AccessToken.for_user(self.user)
+        first = self.authenticate(token)
+        with self.assertNumQueries(0):
+            second = self.authenticate(token)
+        self.assertEqual(second.pk, first.pk)
+        self.assertIsNot(second, first)
+        second.first_name = 'Changed'
+        self.assertEqual(self.authenticate(token).first_name, 'Ada')
+
+    def test_deactivated(self):
+        token = AccessToken.for_user(self.user)
+        self.authenticate(token)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+        # A cached user goes through the same check
+        user_cache.set(self.user.pk, self.user)
+        with self.assertNumQueries(0), self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_password_change(self):
+        # rest_framework_simplejwt rebinds api_settings on setting_changed,
+        # the modules holding it would not see an override_settings()
+        with mock.patch('recipes.authentication.api_settings.CHECK_REVOKE_TOKEN', True):
+            token = AccessToken.for_user(self.user)
+            self.authenticate(token)
+            self.user.set_password('new')
+            self.user.save()
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate(token)
+
+
+class SignupTest(TestCase):
+    """
+        A taken email is refused before the password is hashed, the unique
+        constraints catch the duplicates the lookup does not see.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='cook@example.com', password='pw', first_name='Ada',
+                                            last_name='Cook', phone_number='555-0100')
+
+    def signup(self, path, email, phone_number):
+        return self.client.post(path, {'email': email, 'password': 'pw', 'first_name': 'Bo', 'last_name': 'Baker',
+                                       'phone_number': phone_number}, content_type='application/json')
+
+    def test_taken_email(self):
+        for path in ('/api/signup', '/api/signup/async'):
+            with self.subTest(path=path), \
+                    mock.patch('recipes.hashing.make_password', wraps=make_password) as hashed:
+                response = self.signup(path, 'cook@EXAMPLE.com', '555-0199')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['message'], 'User already exists')
+                hashed.assert_not_called()
+
+    def test_taken_on_insert(self):
+        for path in ('/api/signup', '/api/signup/async'):
+            with self.subTest(path=path), transaction.atomic():
+                response = self.signup(path, 'baker@example.com', '555-0100')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['message'], 'Phone number already used')
+            # The email taken by a concurrent signup after the lookup
+            with self.subTest(path=path, concurrent=True), transaction.atomic(), \
+                    mock.patch.object(QuerySet, 'exists', return_value=False):
+                response = self.signup(path, 'cook@example.com', '555-0199')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['message'], 'User already exists')
+        self.assertEqual(User.objects.count(), 1)
+
+
+class BackgroundLogTest(TestCase):
+    """
+        Records are written as JSON lines by the background handler, stamped
+        with the ID of the request they were logged in.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'test.log')
+
+    def handler(self, **kwargs):
+        handler = BackgroundFileHandler(self.path, **kwargs)
+        handler.setFormatter(JsonFormatter())
+        handler.addFilter(RequestIdFilter())
+        return handler
+
+    def entries(self):
+        with open(self.path, encoding='utf-8') as stream:
+            return [json.loads(line) for line in stream]
+
+    def test_request_id(self):
+        handler = self.handler()
+        logger = logging.getLogger('recipehub.access')
+        logger.addHandler(handler)
+        try:
+            response = self.client.get('/api/home', HTTP_X_REQUEST_ID='req-42')
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+        self.assertEqual(response['X-Request-ID'], 'req-42')
+        entry = self.entries()[-1]
+        self.assertEqual((entry['request_id'], entry['path'], entry['status']), ('req-42', '/api/home', 200))
+
+        # Outside of a request
+        handler = self.handler()
+        logger = logging.getLogger('recipehub.test')
+        logger.addHandler(handler)
+        try:
+            logger.warning("no request", extra={'answer': 42})
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+        entry = self.entries()[-1]
+        self.assertEqual((entry['request_id'], entry['message'], entry['answer']), ('-', 'no request', 42))
+
+    def test_drops_when_full(self):
+        handler = self.handler(queue_size=1)
+        # A writer that fell behind
+        handler.stop_listener()
+        logger = logging.getLogger('recipehub.test')
+        logger.addHandler(handler)
+        try:
+            for i in range(3):
+                logger.warning("record %s", i)
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+        self.assertEqual(handler.dropped, 2)
+
+
+class ProfileRingTest(TestCase):
+    """
+        Profiled requests are kept in a ring of PROFILE_RING_SIZE, and only
+        staff can ask for one.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='cook@example.com', password='pw', first_name='Ada',
+                                            last_name='Cook', phone_number='555-0100')
+        cls.staff = User.objects.create_user(email='staff@example.com', password='pw', first_name='Sam',
+                                             last_name='Staff', phone_number='555-0101', is_staff=True)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overrides = override_settings(PROFILE_DIR=directory.name, PROFILE_RING_SIZE=3)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.directory = directory.name
+
+    def test_ring_is_bounded(self):
+        with override_settings(PROFILE_SAMPLE_RATE=1):
+            for i in range(5):
+                self.client.get('/api/home', HTTP_X_REQUEST_ID=f'req-{i}')
+        profiles = list_profiles()
+        self.assertEqual([profile['request_id'] for profile in profiles], ['req-4', 'req-3', 'req-2'])
+        self.assertEqual({profile['reason'] for profile in profiles}, {'sample'})
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         sorted(f"{profile['name']}.{suffix}" for profile in profiles for suffix in ('json', 'prof')))
+
+    def test_header_needs_staff(self):
+        for user, expected in ((self.user, []), (self.staff, ['header'])):
+            with self.subTest(user=user.email):
+                self.client.get('/api/home', HTTP_X_PROFILE='1',
+                                HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+                self.assertEqual([profile['reason'] for profile in list_profiles()], expected)
+
+
+class LoginTest(TestCase):
+    """
+        Login goes through AUTHENTICATION_BACKENDS with the hashing on the
+        pool: the auth signals are sent, last_login is set, and an unknown
+        email costs a hash like a known one.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='cook@example.com', password='pw', first_name='Ada',
+                                            last_name='Cook', phone_number='555-0100')
+
+    def setUp(self):
+        self.logged_in, self.failed = [], []
+        user_logged_in.connect(self.on_logged_in)
+        user_login_failed.connect(self.on_login_failed)
+        self.addCleanup(user_logged_in.disconnect, self.on_logged_in)
+        self.addCleanup(user_login_failed.disconnect, self.on_login_failed)
+
+    def on_logged_in(self, sender, user, **kwargs):
+        self.logged_in.append(user.email)
+
+    def on_login_failed(self, sender, credentials, **kwargs):
+        self.failed.append(credentials['email'])
+
+    def test_login(self):
+        for path in ('/api/login', '/api/login/async'):
+            with self.subTest(path=path):
+                User.objects.filter(pk=self.user.pk).update(last_login=None)
+                response = self.client.post(path, {'email': 'cook@example.com', 'password': 'pw'},
+                                            content_type='application/json')
+                self.assertEqual(response.status_code, 200, response.content)
+                self.assertEqual(self.logged_in, ['cook@example.com'])
+                self.user.refresh_from_db()
+                self.assertIsNotNone(self.user.last_login)
+                self.logged_in.clear()
+
+    def test_failed_login(self):
+        for path in ('/api/login', '/api/login/async'):
+            for email, password in (('cook@example.com', 'wrong'), ('nobody@example.com', 'pw')):
+                with self.subTest(path=path, email=email), \
+                        mock.patch('recipes.hashing.make_password', wraps=make_password) as hashed, \
+                        mock.patch('recipes.hashing.check_password', wraps=check_password) as checked:
+                    response = self.client.post(path, {'email': email, 'password': password},
+                                                content_type='application/json')
+                    self.assertEqual(response.status_code, 401)
+                    self.assertEqual(self.failed, [email])
+                    # One hash either way, on the pool
+                    self.assertEqual(hashed.call_count + checked.call_count, 1)
+                    self.failed.clear()
+        self.assertEqual(self.logged_in, [])
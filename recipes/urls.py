@@ -20,12 +20,20 @@ from .views import (
     home,
     UserSignupAPI,
     UserLoginAPI,
+    AsyncUserSignupView,
+    AsyncUserLoginView,
     ListCreateRecipeAPI,
     ListGetRecipeAPI,
+    RecipeFacetAPI,
+    RecipeExportAPI,
+    RecipeImportAPI,
     ReviewRecipeAPI,
+    BatchReviewAPI,
     ReviewDetailAPI,
     ListUpdateDeleteRecipeAPI,
-    SearchAPI
+    RecipeDetailCacheStatsAPI,
+    SearchAPI,
+    AutocompleteAPI
     
 )
 from rest_framework_simplejwt.views import (
@@ -37,12 +45,20 @@ urlpatterns = [
     path('home', home, name='home'),
     path('signup', UserSignupAPI.as_view(), name='signup'),
     path('login', UserLoginAPI.as_view(), name='login'),
+    path('signup/async', AsyncUserSignupView.as_view(), name='signup-async'),
+    path('login/async', AsyncUserLoginView.as_view(), name='login-async'),
     path('recipe', ListCreateRecipeAPI.as_view(), name='create-recipe'),
     path('recipes', ListGetRecipeAPI.as_view(), name='list-recipes'),
+    path('recipes/facets', RecipeFacetAPI.as_view(), name='recipe-facets'),
+    path('recipes/export', RecipeExportAPI.as_view(), name='export-recipes'),
+    path('recipes/import', RecipeImportAPI.as_view(), name='import-recipes'),
     path('recipe/<int:pk>', ListUpdateDeleteRecipeAPI.as_view(), name='update-recipe'),
+    path('recipes/detail-cache/stats', RecipeDetailCacheStatsAPI.as_view(), name='recipe-detail-cache-stats'),
     path('reviews', ReviewRecipeAPI.as_view(), name='create-review'),
+    path('reviews/batch', BatchReviewAPI.as_view(), name='create-reviews-batch'),
     path('reviews/<int:pk>', ReviewDetailAPI.as_view(), name='review-detail'),
     path('reviews/<int:pk>', ReviewDetailAPI.as_view(), name='review-detail'),
     path('search/<str:query>', SearchAPI.as_view(), name='search'),
+    path('autocomplete', AutocompleteAPI.as_view(), name='autocomplete'),
     path('token/refresh', TokenRefreshView.as_view(), name='token_refresh'),
 ]
@@ -1,4 +1,10 @@
 import copy
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from rest_framework.exceptions import ValidationError
 from rest_framework.views import exception_handler
 from rest_framework.response import Response
 from .constant import RESPONSE_FAILED, RESPONSE_SUCCESS
@@ -18,4 +24,153 @@ def custom_exception_handler(exc, context):
         _response['data'] = response.data
         response.data = _response
 
-    return response
\ No newline at end of file
+    return response
+
+
+CATALOGUE_GENERATION_KEY = 'recipes:catalogue-generation'
+
+
+def catalogue_generation():
+    """
+        A counter that changes whenever a Recipe or Review is written.
+
+        Cache keys of data derived from the catalogue include it, so bumping it
+        invalidates all of them at once.
+    """
+    return cache.get_or_set(CATALOGUE_GENERATION_KEY, 0, timeout=None)
+
+
+def bump_catalogue_generation():
+    try:
+        cache.incr(CATALOGUE_GENERATION_KEY)
+    except ValueError:
+        cache.set(CATALOGUE_GENERATION_KEY, 1, timeout=None)
+
+
+def make_etag(*parts):
+    """
+        A strong ETag built from the values a representation is derived from.
+    """
+    return quote_etag(hashlib.md5("|".join(str(part) for part in parts).encode()).hexdigest())
+
+
+def not_modified_response(request, etag, last_modified=None):
+    """
+        A 304 response when the request's If-None-Match / If-Modified-Since
+        validators still match, otherwise None.
+
+        If-None-Match takes precedence over If-Modified-Since, as RFC 9110
+        requires. POST /recipes is a read, so it is handled like a GET.
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = [tag.removeprefix('W/') for tag in parse_etags(if_none_match)]
+        matched = '*' in etags or etag in etags
+    else:
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        matched = (
+            if_modified_since is not None and last_modified is not None
+            and int(last_modified.timestamp()) <= if_modified_since
+        )
+    if not matched:
+        return None
+    response = Response(status=304)
+    set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+def get_requested_fields(request, allowed_fields, param='fields'):
+    """
+        Parse a ``?fields=id,title`` projection parameter, None when it is not given.
+    """
+    raw = request.query_params.get(param)
+    if not raw:
+        return None
+    fields = [field.strip() for field in raw.split(',') if field.strip()]
+    invalid = [field for field in fields if field not in allowed_fields]
+    if invalid:
+        raise ValidationError({param: f"Invalid field(s) {', '.join(invalid)}. Fields must be one of: {', '.join(allowed_fields)}."})
+    return fields
+
+
+def violated_unique_field(exc, model):
+    """
+        Name of the ``model`` field whose unique constraint an IntegrityError reports, or None.
+
+        SQLite names the column ("UNIQUE constraint failed: tabUser.email"),
+        PostgreSQL and MySQL the constraint or key, which is named after it.
+    """
+    message = str(exc)
+    constraint = getattr(getattr(exc.__cause__, 'diag', None), 'constraint_name', None)
+    for field in model._meta.concrete_fields:
+        if not field.unique or field.primary_key:
+            continue
+        if f"{model._meta.db_table}.{field.column}" in message or field.column in (constraint or message):
+            return field.name
+    return None
+
+
+def dictfetchall(cursor):
+    """
+        Return all rows from a cursor as a list of dicts keyed by column name.
+    """
+    columns = [col[0] for col in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+class LazyRawQuery:
+    """
+        A raw SELECT that is only executed one page at a time.
+
+        Django's ``Paginator`` (and so ``CustomPagination``) only needs ``count()``
+        and slicing from the object list. Slicing runs the query with
+        ``LIMIT``/``OFFSET`` and ``count()`` runs a separate ``COUNT(*)`` whose
+        result is cached until the catalogue changes (or for at most
+        ``RECIPE_COUNT_CACHE_TIMEOUT`` seconds), so a request never reads more
+        rows than the page it returns.
+    """
+    ordered = True
+
+    def __init__(self, query, params=None, order_by='id'):
+        self.query = query
+        self.params = list(params or [])
+        self.order_by = order_by
+
+    def _execute(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return dictfetchall(cursor)
+
+    def count(self):
+        sql = f"SELECT COUNT(*) AS total FROM ({self.query}) AS counted"
+        digest = hashlib.md5(f"{sql}|{self.params!r}".encode()).hexdigest()
+        key = f"raw-count:{catalogue_generation()}:{digest}"
+        total = cache.get(key)
+        if total is None:
+            total = self._execute(sql, self.params)[0]['total']
+            cache.set(key, total, getattr(settings, 'RECIPE_COUNT_CACHE_TIMEOUT', 60))
+        return total
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        offset = item.start or 0
+        limit = -1 if item.stop is None else max(item.stop - offset, 0)
+        return self._execute(*self.get_page_sql(limit, offset))
+
+    def get_page_sql(self, limit, offset):
+        sql = f"{self.query} ORDER BY {self.order_by} LIMIT %s OFFSET %s"
+        return sql, self.params + [limit, offset]
+
+    def __iter__(self):
+        return iter(self[0:None])
@@ -1,6 +1,9 @@
 import copy
 from django.shortcuts import render
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework.generics import (
     CreateAPIView, GenericAPIView, 
     RetrieveUpdateAPIView, RetrieveUpdateDestroyAPIView, 
@@ -14,21 +17,39 @@ from django.db.utils import IntegrityError
 from .serializers import (
     UserSerializer, UserLoginSerializer, CreateRecipeSerializer, CreateRecipeSerializer2,
     ReviewSerializer, UpdateReviewSerializer, UpdateRecipeSerializer, AllReviewSerializer,
-    SearchSerializer, ListRequestRecipeSerializer, RecipeSerializer
+    SearchSerializer, ListRequestRecipeSerializer, RecipeSerializer, RECIPE_PROJECTION_FIELDS,
+    BatchReviewSerializer
 )
 from .models import (
     Recipe, Review, User
 )
-from .utils import success_response
-from .constant import RESPONSE_SUCCESS, RESPONSE_FAILED, CustomPagination
+from .utils import (
+    success_response, LazyRawQuery, get_requested_fields, dictfetchall, catalogue_generation,
+    make_etag, not_modified_response, set_validators, violated_unique_field
+)
+from .constant import RESPONSE_SUCCESS, RESPONSE_FAILED, USER_CONFLICT_MESSAGES, CustomPagination
+from .pagination import KeysetPagination, get_ordering, order_by_sql, encode_cursor, decode_cursor
+from .filters import compile_filters
+from .facets import get_facets
+from .exporters import EXPORT_CONTENT_TYPES, EXPORT_WRITERS
+from .search import search_recipes, fuzzy_search_recipes
+from .autocomplete import prefix_index
+from .ingest import ingest_reviews, import_recipes, IMPORT_READERS
+from .hashing import PasswordHashingBusy, authenticate_user, aauthenticate_user, ahash_password
+from .detail_cache import (
+    detail_cache_key, get_cached_detail, set_cached_detail, invalidate_recipe_detail, detail_cache_info
+)
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
-from rest_framework.authentication import authenticate
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.parsers import MultiPartParser
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import replace_query_param
 from django.db import connection
 from drf_yasg import openapi
 from django_filters.rest_framework import DjangoFilterBackend
+import codecs
 import json
 
 # Create your views here.
@@ -37,6 +58,38 @@ def home(request):
     return HttpResponse("Hello Home")
 
 
+def hashing_busy_response(response_class=Response):
+    response = copy.deepcopy(RESPONSE_FAILED)
+    response["message"] = "Too many logins in progress, retry shortly"
+    response = response_class(response, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    response['Retry-After'] = '1'
+    return response
+
+
+def user_conflict_response(ex, data, response_class=Response):
+    """
+        The answer to a signup whose INSERT hit a unique constraint of tabUser.
+    """
+    field = violated_unique_field(ex, User)
+    if field not in USER_CONFLICT_MESSAGES:
+        return response_class({"error": str(ex), "request_data": data}, status=status.HTTP_400_BAD_REQUEST)
+    return user_taken_response(field, response_class)
+
+
+def user_taken_response(field, response_class=Response):
+    """
+        The answer to a signup whose ``field`` belongs to another user.
+    """
+    response = copy.deepcopy(RESPONSE_FAILED)
+    response["message"] = USER_CONFLICT_MESSAGES[field]
+    return response_class(response, status=status.HTTP_400_BAD_REQUEST)
+
+
+def users_with_email(email):
+    # Emails are stored normalized, see CustomUserManager.build_user()
+    return User.objects.filter(email=User.objects.normalize_email(email))
+
+
 class UserSignupAPI(CreateAPIView):
     serializer_class = UserSerializer
 
@@ -47,28 +100,24 @@ class UserSignupAPI(CreateAPIView):
         responses={201: UserSerializer}
     )
     def post(self, request, *args, **kwargs):
+        # A taken email, the usual duplicate, is found by one indexed lookup
+        # before the password is hashed. The INSERT still reports what the
+        # lookup misses: a taken phone number or a concurrent signup.
         try:
-            if User.objects.filter(email=request.data.get("email")).exists():
-                response = copy.deepcopy(RESPONSE_FAILED)
-                response["message"] = "User already exists"
-                return Response(response, status=status.HTTP_400_BAD_REQUEST)
-            if User.objects.filter(phone_number=request.data.get("phone_number")).exists():
-                response = copy.deepcopy(RESPONSE_FAILED)
-                response["message"] = "Phone number already used"
-                return Response(response, status=status.HTTP_400_BAD_REQUEST)
             serializer = self.get_serializer(data=request.data)
             serializer.is_valid(raise_exception=True)
+            if users_with_email(serializer.validated_data['email']).exists():
+                return user_taken_response('email')
             self.perform_create(serializer)
             headers = self.get_success_headers(serializer.data)
             response = copy.deepcopy(RESPONSE_SUCCESS)
             response["message"] = "User Created Successfully"
             response["data"] = serializer.data
             return Response(response, status=status.HTTP_201_CREATED, headers=headers)
+        except PasswordHashingBusy:
+            return hashing_busy_response()
         except IntegrityError as ex:
-            response = copy.deepcopy(RESPONSE_FAILED)
-            response["data"] = request.data
-            response["message"] = str(ex)
-            return Response({"error": str(ex), "request_data":request.data}, status=status.HTTP_400_BAD_REQUEST)
+            return user_conflict_response(ex, request.data)
 
 
 class UserLoginAPI(CreateAPIView):
@@ -86,8 +135,11 @@ class UserLoginAPI(CreateAPIView):
         email = serializer.validated_data['email']
         password = serializer.validated_data['password']
 
-        # Custom logic to authenticate user (e.g., using Django's built-in authenticate method)
-        user = authenticate(request, username=email, password=password)
+        # authenticate() through HashingPoolBackend, the password is hashed on the pool
+        try:
+            user = authenticate_user(request, email, password)
+        except PasswordHashingBusy:
+            return hashing_busy_response()
 
         if user:
             refresh = RefreshToken.for_user(user)
@@ -107,6 +159,94 @@ class UserLoginAPI(CreateAPIView):
         
 
 
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncUserSignupView(View):
+    """
+        UserSignupAPI as a native async view, for ASGI deployments.
+
+        The database calls are awaited and the password is hashed on the
+        hashing pool, so the event loop keeps serving other requests meanwhile.
+    """
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            response = copy.deepcopy(RESPONSE_FAILED)
+            response["message"] = "Request body must be a JSON object"
+            return JsonResponse(response, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = UserSerializer(data=data)
+        if not serializer.is_valid():
+            response = copy.deepcopy(RESPONSE_FAILED)
+            response["data"] = serializer.errors
+            return JsonResponse(response, status=status.HTTP_400_BAD_REQUEST)
+
+        validated_data = serializer.validated_data
+        # See UserSignupAPI
+        if await users_with_email(validated_data['email']).aexists():
+            return user_taken_response('email', JsonResponse)
+        try:
+            user = User.objects.build_user(
+                password=await ahash_password(validated_data['password']),
+                email=validated_data['email'],
+                first_name=validated_data['first_name'],
+                last_name=validated_data['last_name'],
+                phone_number=validated_data['phone_number']
+            )
+            await user.asave()
+        except PasswordHashingBusy:
+            return hashing_busy_response(JsonResponse)
+        except IntegrityError as ex:
+            return user_conflict_response(ex, data, JsonResponse)
+
+        response = copy.deepcopy(RESPONSE_SUCCESS)
+        response["message"] = "User Created Successfully"
+        response["data"] = UserSerializer(user).data
+        return JsonResponse(response, status=status.HTTP_201_CREATED)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncUserLoginView(View):
+    """
+        UserLoginAPI as a native async view, for ASGI deployments.
+    """
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            data = None
+        serializer = UserLoginSerializer(data=data if isinstance(data, dict) else {})
+        if not serializer.is_valid():
+            response = copy.deepcopy(RESPONSE_FAILED)
+            response["data"] = serializer.errors
+            return JsonResponse(response, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            user = await aauthenticate_user(request, serializer.validated_data['email'], serializer.validated_data['password'])
+        except PasswordHashingBusy:
+            return hashing_busy_response(JsonResponse)
+
+        if user:
+            refresh = RefreshToken.for_user(user)
+            response = copy.deepcopy(RESPONSE_SUCCESS)
+            response["message"] = "Login Successfully"
+            response["data"] = {
+                "user_info": user.get_user_data_for_response(),
+                "refresh": str(refresh),
+                "access": str(refresh.access_token)
+            }
+            return JsonResponse(response, status=status.HTTP_200_OK)
+        else:
+            response = copy.deepcopy(RESPONSE_FAILED)
+            response["message"] = "Invalid credentials"
+            response["data"] = data
+            return JsonResponse(response, status=status.HTTP_401_UNAUTHORIZED)
+
+
 class ListCreateRecipeAPI(CreateAPIView):
     
     queryset = Recipe.objects.all()
@@ -140,93 +280,70 @@ class ListGetRecipeAPI(CreateAPIView):
         tags=['Recipe'],
         operation_description="List Recipes",
         request_body=ListRequestRecipeSerializer,
+        manual_parameters=[
+            openapi.Parameter('pagination', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=['page', 'cursor'],
+                              description="'cursor' switches to keyset pagination with opaque next/previous cursors"),
+            openapi.Parameter('cursor', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              description="Cursor taken from a previous next/previous link"),
+            openapi.Parameter('ordering', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              description="Sort by avg_rating, cooking_time, serving_size, created_at or title, '-' prefix for descending"),
+            openapi.Parameter('fields', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              description="Comma separated recipe fields to return, e.g. id,title,category_id,cooking_time,avg_rating"),
+        ],
         responses={200: RecipeSerializer(many=True)}
     )
     def post(self, request):
+        filters = []
         if request.data:
             serializer_class = ListRequestRecipeSerializer
             serializer = serializer_class(data=request.data)
             serializer.is_valid(raise_exception=True)
-        filters = request.data.get('filters', [])
-
-        with connection.cursor() as cursor:
-            query = """
-                SELECT trc.*, AVG(tr.rating) AS avg_rating
-                FROM tabRecipe AS trc
-                LEFT JOIN tabReview AS tr ON trc.id = tr.recipe_id
-            """
-            where_conditions = []
-            having_conditions = []
-
-            for f in filters:
-                field = f.get('field')
-                operator = f.get('operator')
-                value = f.get('value')
-                if field and operator and value:
-                    if operator == '=':
-                        try:
-                            value = float(value)
-                        except ValueError as ex: 
-                            value = "'"+value+"'"
-                        if field == 'avg_rating':
-                            having_conditions.append(f"{field} = {value}")
-                        else:
-                            where_conditions.append(f"{field} ={value}")
-
-                    elif operator == '!=':
-                        try:
-                            value = float(value)
-                        except ValueError as ex: 
-                            value = "'"+value+"'"
-                        if field == 'avg_rating':
-                            having_conditions.append(f"{field} != {value}")
-                        else:
-                            where_conditions.append(f"{field} != {value}")
-
-                    elif operator == 'in':
-                        value_s = [str(v) for v in value]
-                        value_s = [f'"{v}"' for v in value]
-                        placeholders = ', '.join(value_s)
-                        if field == 'avg_rating':
-                            having_conditions.append(f"{field} IN ({placeholders})")
-                        else:                          
-                            where_conditions.append(f"{field} IN ({placeholders})")
-
-                    elif operator == 'not in':
-                        value_s = [str(v) for v in value]
-                        value_s = [f'"{v}"' for v in value]
-                        placeholders = ', '.join(value_s)
-                        if field == 'avg_rating':
-                            having_conditions.append(f"{field} NOT IN ({placeholders})")
-                        else:
-                            where_conditions.append(f"{field} NOT IN ({placeholders})")
-
-                    elif operator == 'like':
-                        having_conditions.append(f"CAST({field} AS TEXT) LIKE '%{value}%'")
-
-            if where_conditions or having_conditions:
-                if where_conditions:
-                    query += " WHERE " + " AND ".join(where_conditions)
-                    query += " GROUP BY trc.id;"
-                if having_conditions:
-                    query += " GROUP BY trc.id"
-                    query += " HAVING " + " AND ".join(having_conditions)
-                    
-                print(query)
-                cursor.execute(query)
-                columns = [col[0] for col in cursor.description]
-                recipes_data = [dict(zip(columns, row)) for row in cursor.fetchall()]
-            else:
-                # No filters applied, retrieve all recipes
-                cursor.execute("""
-                    SELECT trc.*, AVG(tr.rating) AS avg_rating
-                    FROM tabRecipe AS trc
-                    LEFT JOIN tabReview AS tr ON trc.id = tr.recipe_id
-                    GROUP BY trc.id;
-                """)
-                columns = [col[0] for col in cursor.description]
-                recipes_data = [dict(zip(columns, row)) for row in cursor.fetchall()]
-
+            filters = serializer.validated_data.get('filters', [])
+
+        # The ETag changes with the recipe delete counter and MAX(updated_at),
+        # both read from the database so writes made through any worker count,
+        # and with this worker's catalogue generation, bumped by bulk writes
+        # too. No Last-Modified: no date changes when a recipe is deleted, so
+        # If-Modified-Since cannot be answered safely.
+        recipe_deletes, last_updated = Recipe.objects.list_version()
+        etag = make_etag('recipes', request.get_full_path(), json.dumps(request.data, sort_keys=True, default=str),
+                         catalogue_generation(), recipe_deletes, last_updated)
+        not_modified = not_modified_response(request, etag)
+        if not_modified is not None:
+            return not_modified
+
+        response = self.list_recipes(request, filters)
+        return set_validators(response, etag)
+
+    def list_recipes(self, request, filters):
+        cursor_mode = request.query_params.get('pagination') == 'cursor'
+        ordering = get_ordering(request, KeysetPagination.default_ordering if cursor_mode else None)
+
+        # Only the projected columns are read, plus id and the sort key that
+        # pagination needs. The large text columns stay on disk unless asked for.
+        fields = get_requested_fields(request, RECIPE_PROJECTION_FIELDS)
+        if fields is None:
+            select = "trc.*"
+        else:
+            columns = dict.fromkeys(['id'] + fields + ([ordering.lstrip('-')] if ordering else []))
+            select = ", ".join(f"trc.{column}" for column in columns)
+
+        # avg_rating is stored on tabRecipe, so every filter is a plain WHERE
+        # condition and no join/GROUP BY over tabReview is needed.
+        where_sql, params = compile_filters(filters)
+        query = f"SELECT {select} FROM tabRecipe AS trc"
+        if where_sql:
+            query += " WHERE " + where_sql
+
+        if cursor_mode:
+            paginator = KeysetPagination()
+            page = paginator.paginate_raw_query(query, params, request)
+            serializer = RecipeSerializer(page, many=True, fields=fields)
+            return success_response(data=paginator.get_paginated_data(serializer.data), status=status.HTTP_200_OK, message='Recipes details')
+
+        # Only the requested page is read (LIMIT/OFFSET), the total comes from
+        # a separate cached COUNT(*).
+        recipes_data = LazyRawQuery(query, params, order_by=order_by_sql(ordering))
 
         # correct changes ------------
         # with connection.cursor() as cursor:
@@ -261,11 +378,11 @@ class ListGetRecipeAPI(CreateAPIView):
         page = paginator.paginate_queryset(recipes_data, request)
 
         if page is not None:
-            serializer = RecipeSerializer(page, many=True)
+            serializer = RecipeSerializer(page, many=True, fields=fields)
             res = paginator.get_paginated_response(serializer.data)
             return success_response(data = res.data, status=status.HTTP_200_OK, message='Recipes details')
 
-        serializer = RecipeSerializer(recipes_data, many=True)
+        serializer = RecipeSerializer(recipes_data, many=True, fields=fields)
         return success_response(serializer.data, status=status.HTTP_200_OK, message='Recipes details')
 
     def get_page_size(self, request):
@@ -278,10 +395,103 @@ class ListGetRecipeAPI(CreateAPIView):
         return page_size
 
 
+class RecipeFacetAPI(GenericAPIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        tags=['Search & Filter'],
+        operation_description="Recipe counts per category, cooking time bucket and rating bucket for the given filters",
+        request_body=ListRequestRecipeSerializer,
+    )
+    def post(self, request):
+        filters = []
+        if request.data:
+            serializer = ListRequestRecipeSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            filters = serializer.validated_data.get('filters', [])
+
+        return success_response(get_facets(filters), status=status.HTTP_200_OK, message='Recipe facets')
+
+
+class RecipeExportAPI(GenericAPIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        tags=['Recipe'],
+        operation_description="Stream the whole catalogue, rating aggregates included, as NDJSON or CSV",
+        manual_parameters=[
+            openapi.Parameter('file_format', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              enum=list(EXPORT_WRITERS), default='ndjson'),
+        ],
+    )
+    def get(self, request):
+        file_format = request.query_params.get('file_format', 'ndjson')
+        if file_format not in EXPORT_WRITERS:
+            response = copy.deepcopy(RESPONSE_FAILED)
+            response['message'] = f"file_format must be one of: {', '.join(EXPORT_WRITERS)}"
+            return Response(response, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(EXPORT_WRITERS[file_format](), content_type=EXPORT_CONTENT_TYPES[file_format])
+        response['Content-Disposition'] = f'attachment; filename="recipes.{file_format}"'
+        return response
+
+
+class RecipeImportAPI(GenericAPIView):
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    @swagger_auto_schema(
+        tags=['Recipe'],
+        operation_description="Create recipes from an uploaded NDJSON or CSV file. "
+                              "Rejected rows, title conflicts included, are reported by line and skipped.",
+        manual_parameters=[
+            openapi.Parameter('file', openapi.IN_FORM, type=openapi.TYPE_FILE, required=True),
+            openapi.Parameter('file_format', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              enum=list(IMPORT_READERS), default='ndjson'),
+        ],
+    )
+    def post(self, request):
+        file_format = request.query_params.get('file_format', 'ndjson')
+        upload = request.FILES.get('file')
+        if file_format not in IMPORT_READERS or upload is None:
+            response = copy.deepcopy(RESPONSE_FAILED)
+            response['message'] = f"Upload a file and set file_format to one of: {', '.join(IMPORT_READERS)}"
+            return Response(response, status=status.HTTP_400_BAD_REQUEST)
+
+        # Read line by line from the upload, never as a whole
+        lines = codecs.iterdecode(upload, 'utf-8', errors='replace')
+        created, errors = import_recipes(request.user, IMPORT_READERS[file_format](lines))
+
+        data = {'created': created, 'errors': errors}
+        if not created:
+            response = copy.deepcopy(RESPONSE_FAILED)
+            response['data'] = data
+            response['message'] = "No Recipe Imported"
+            return Response(response, status=status.HTTP_400_BAD_REQUEST)
+        if errors:
+            return success_response(data, status=status.HTTP_207_MULTI_STATUS, message="Recipes Partially Imported")
+        return success_response(data, status=status.HTTP_201_CREATED, message="Recipes Imported Successfully")
+
+
 class ListUpdateDeleteRecipeAPI(RetrieveUpdateDestroyAPIView):
     queryset = Recipe.objects.all()
     serializer_class = UpdateRecipeSerializer
     permission_classes = [IsAuthenticated]
+    projection_fields = tuple(field for field in UpdateRecipeSerializer.Meta.fields if field != 'user_id')
+    requested_fields = None
+    reviews_page_size = 10
+    reviews_page_size_query_param = 'reviews_page_size'
+    reviews_cursor_query_param = 'reviews_cursor'
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.requested_fields is not None:
+            # Serializer field names to model fields, e.g. category_id -> category
+            model_fields = {'category_id': 'category'}
+            queryset = queryset.only(
+                'avg_rating', 'review_count', *[model_fields.get(field, field) for field in self.requested_fields]
+            )
+        return queryset
     
     @swagger_auto_schema(
         tags=['Recipe'],
@@ -296,6 +506,7 @@ class ListUpdateDeleteRecipeAPI(RetrieveUpdateDestroyAPIView):
             response["message"] = "You are not authorized to update this recipe"
             return Response(response, status=status.HTTP_403_FORBIDDEN)
         response = super().update(request, *args, **kwargs)
+        invalidate_recipe_detail(kwargs['pk'])
         return success_response(data=response.data, status=status.HTTP_200_OK, message="Recipe Updated Successfully")
 
 
@@ -312,45 +523,141 @@ class ListUpdateDeleteRecipeAPI(RetrieveUpdateDestroyAPIView):
             response["message"] = "You are not authorized to delete this recipe"
             return Response(response, status=status.HTTP_403_FORBIDDEN)
         response = super().delete(request, *args, **kwargs)
+        invalidate_recipe_detail(kwargs['pk'])
         return success_response(data=response.data, status=status.HTTP_204_NO_CONTENT, message="Recipe Deleted Successfully")
 
     @swagger_auto_schema(
         tags=['Recipe'],
-        operation_description="Retrieve Recipe",
+        operation_description="Retrieve Recipe with its rating histogram and the newest page of reviews",
+        manual_parameters=[
+            openapi.Parameter('fields', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              description="Comma separated recipe fields to return, e.g. id,title,cooking_time"),
+            openapi.Parameter('reviews_page_size', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, default=10),
+            openapi.Parameter('reviews_cursor', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              description="Cursor taken from reviews_next"),
+        ],
         responses={200: UpdateRecipeSerializer}
     )
     def get(self, request, *args, **kwargs):
-        with connection.cursor() as cursor:
-            cursor.execute(f"""
-                SELECT
-                tr.*,
-                tu.first_name, 
-                tu.last_name
-                FROM
-                tabReview AS tr
-                LEFT JOIN
-                tabUser AS tu ON tr.user_id = tu.id          
-                LEFT JOIN
-                tabRecipe AS rc ON tr.recipe_id = rc.id
-                WHERE 
-                tr.recipe_id = {kwargs['pk']};  
-            """)
-            rows = cursor.fetchall()
-        columns = [col[0] for col in cursor.description]
-        reviews = [dict(zip(columns, row)) for row in rows]
-        recipe = super().get(request, *args, **kwargs)
+        validators = Recipe.objects.filter(pk=kwargs['pk']).values_list('updated_at', 'review_count', 'rating_sum').first()
+        if validators is not None:
+            etag = make_etag('recipe', request.get_full_path(), *validators)
+            not_modified = not_modified_response(request, etag, validators[0])
+            if not_modified is not None:
+                return not_modified
+
+        cache_key = None
+        if validators is not None and request.accepted_renderer.format == 'json':
+            # The host is part of the variant, reviews_next is an absolute link
+            cache_key = detail_cache_key(kwargs['pk'], etag, f"{request.get_host()}|{request.accepted_media_type}")
+            cached = get_cached_detail(cache_key)
+            if cached is not None:
+                content, content_type = cached
+                return set_validators(HttpResponse(content, content_type=content_type), etag, validators[0])
+
+        self.requested_fields = get_requested_fields(request, self.projection_fields)
+        instance = self.get_object()
+        recipe = self.get_serializer(instance, fields=self.requested_fields)
+        reviews, reviews_next = self.get_review_page(request, instance.pk)
 
         if recipe:
             response = copy.deepcopy(RESPONSE_SUCCESS)
             response['data']['recipe'] = recipe.data
+            response['data']['rating'] = {
+                'avg_rating': instance.avg_rating,
+                'review_count': instance.review_count,
+                'histogram': self.get_rating_histogram(instance.pk),
+            }
             response['data']['reviews'] = reviews
+            response['data']['reviews_next'] = reviews_next
             response['message'] = "Recipe Retrieved Successfully"
-            return Response(response, status=status.HTTP_200_OK)
+            response = Response(response, status=status.HTTP_200_OK)
+            if cache_key is not None:
+                self.render_into_cache(response, cache_key)
+            return set_validators(response, etag, validators[0])
         else:
             response = copy.deepcopy(RESPONSE_FAILED)
             response['message'] = "Recipe Not Found"
             return Response(response, status=status.HTTP_404_NOT_FOUND)
 
+    def render_into_cache(self, response, cache_key):
+        # Rendered here rather than by finalize_response, to keep the bytes
+        response.accepted_renderer = self.request.accepted_renderer
+        response.accepted_media_type = self.request.accepted_media_type
+        response.renderer_context = self.get_renderer_context()
+        response.render()
+        set_cached_detail(cache_key, response.content, response['Content-Type'])
+
+    def get_rating_histogram(self, recipe_id):
+        # Answered from the (recipe_id, rating) index alone
+        histogram = {str(rating): 0 for rating in range(0, 6)}
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT rating, COUNT(*) FROM tabReview WHERE recipe_id = %s GROUP BY rating",
+                [recipe_id],
+            )
+            for rating, count in cursor.fetchall():
+                histogram[str(rating)] = count
+        return histogram
+
+    def get_review_page(self, request, recipe_id):
+        """
+            One page of the recipe's reviews, newest first, and the link to the next one.
+
+            Pages are read by keyset on (created_at, id) through the
+            (recipe_id, created_at, id) index, so a page costs the same however
+            many reviews the recipe has.
+        """
+        try:
+            page_size = min(max(int(request.query_params.get(self.reviews_page_size_query_param, self.reviews_page_size)), 1), CustomPagination.max_page_size)
+        except ValueError:
+            page_size = self.reviews_page_size
+
+        query = """
+            SELECT tr.id, tr.user_id, tr.recipe_id, tr.rating, tr.comment, tr.created_at,
+                   tu.first_name, tu.last_name
+            FROM tabReview AS tr
+            LEFT JOIN tabUser AS tu ON tr.user_id = tu.id
+            WHERE tr.recipe_id = %s
+        """
+        params = [recipe_id]
+        token = request.query_params.get(self.reviews_cursor_query_param)
+        if token:
+            cursor = decode_cursor(token)
+            # created_at is sent as a string, ids are integers
+            if not isinstance(cursor.get('v'), str) or type(cursor.get('id')) is not int:
+                raise NotFound('Invalid cursor')
+            query += " AND (tr.created_at, tr.id) < (%s, %s)"
+            params += [cursor['v'], cursor['id']]
+        query += " ORDER BY tr.created_at DESC, tr.id DESC LIMIT %s"
+        params.append(page_size + 1)
+
+        with connection.cursor() as cursor:
+            cursor.execute(query, params)
+            reviews = dictfetchall(cursor)
+
+        next_link = None
+        if len(reviews) > page_size:
+            reviews = reviews[:page_size]
+            last = reviews[-1]
+            next_link = replace_query_param(
+                request.build_absolute_uri(), self.reviews_cursor_query_param,
+                encode_cursor({'v': str(last['created_at']), 'id': last['id']}),
+            )
+        return reviews, next_link
+
+
+class RecipeDetailCacheStatsAPI(GenericAPIView):
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        tags=['Recipe'],
+        operation_description="Hit / miss counters of the recipe detail cache in this worker, staff only",
+    )
+    def get(self, request, *args, **kwargs):
+        return success_response(data=detail_cache_info(), status=status.HTTP_200_OK, message="Recipe Detail Cache Stats")
+
+
 class ReviewRecipeAPI(CreateAPIView):
     serializer_class = ReviewSerializer
     permission_classes = [IsAuthenticated]
@@ -369,6 +676,36 @@ class ReviewRecipeAPI(CreateAPIView):
 
         return success_response(serializer.data, status=status.HTTP_201_CREATED,message="Review Created Successfully")
 
+class BatchReviewAPI(GenericAPIView):
+    serializer_class = BatchReviewSerializer
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        tags=['Reviews'],
+        operation_description="Create up to REVIEW_BATCH_MAX_SIZE reviews in one transaction. "
+                              "Invalid items are skipped and reported by their index.",
+        request_body=BatchReviewSerializer,
+        security=[{'Bearer': []}]
+    )
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        reviews, errors = ingest_reviews(request.user, serializer.validated_data['reviews'])
+
+        data = {
+            'created': len(reviews),
+            'ids': [review.id for review in reviews],
+            'errors': errors,
+        }
+        if not reviews:
+            response = copy.deepcopy(RESPONSE_FAILED)
+            response['data'] = data
+            response['message'] = "No Review Created"
+            return Response(response, status=status.HTTP_400_BAD_REQUEST)
+        if errors:
+            return success_response(data, status=status.HTTP_207_MULTI_STATUS, message="Reviews Partially Created")
+        return success_response(data, status=status.HTTP_201_CREATED, message="Reviews Created Successfully")
+
 # Retrieve and Update API
 class ReviewDetailAPI(RetrieveUpdateDestroyAPIView):
     queryset = Review.objects.all()
@@ -381,8 +718,16 @@ class ReviewDetailAPI(RetrieveUpdateDestroyAPIView):
         responses={200: ReviewSerializer}
     )
     def get(self, request, *args, **kwargs):
+        last_modified = Review.objects.filter(pk=kwargs['pk']).values_list('updated_at', flat=True).first()
+        if last_modified is not None:
+            etag = make_etag('review', kwargs['pk'], last_modified)
+            not_modified = not_modified_response(request, etag, last_modified)
+            if not_modified is not None:
+                return not_modified
+
         response = super().get(request, *args, **kwargs)
-        return success_response(data=response.data, status=status.HTTP_200_OK, message='Review Retrieved Successfully')
+        response = success_response(data=response.data, status=status.HTTP_200_OK, message='Review Retrieved Successfully')
+        return set_validators(response, etag, last_modified)
 
     @swagger_auto_schema(
         tags=['Reviews'],
@@ -391,12 +736,13 @@ class ReviewDetailAPI(RetrieveUpdateDestroyAPIView):
         responses={200: ReviewSerializer}
     )
     def put(self, request, *args, **kwargs):
-        review_user_id = Review.objects.get(id=kwargs['pk']).user_id
-        if not request.user.id == review_user_id:
+        review = Review.objects.get(id=kwargs['pk'])
+        if not request.user.id == review.user_id:
             response = copy.deepcopy(RESPONSE_FAILED)
             response["message"] = "You are not authorized to update this review"
             return Response(response, status=status.HTTP_403_FORBIDDEN)
         response = super().update(request, *args, **kwargs)
+        invalidate_recipe_detail(review.recipe_id, response.data.get('recipe'))
         return success_response(data=response.data, status=status.HTTP_200_OK, message="Review Updated Successfully")
     
     
@@ -407,12 +753,13 @@ class ReviewDetailAPI(RetrieveUpdateDestroyAPIView):
         # responses={200: ReviewSerializer}
     )
     def delete(self, request, *args, **kwargs):
-        review_user_id = Review.objects.get(id=kwargs['pk']).user_id
-        if not request.user.id == review_user_id:
+        review = Review.objects.get(id=kwargs['pk'])
+        if not request.user.id == review.user_id:
             response = copy.deepcopy(RESPONSE_FAILED)
             response["message"] = "You are not authorized to delete this review"
             return Response(response, status=status.HTTP_403_FORBIDDEN)
         response = super().delete(request, *args, **kwargs)
+        invalidate_recipe_detail(review.recipe_id)
         return success_response(data=response.data, status=status.HTTP_200_OK, message="Review Deleted Successfully")
 
 
@@ -423,7 +770,12 @@ class SearchAPI(GenericAPIView):
     
     @swagger_auto_schema(
         tags=['Search & Filter'],
-        operation_description="Search API",
+        operation_description="Full-text search over title, category, description and ingredients, best match first. "
+                              "Falls back to typo tolerant matching on titles and ingredients when nothing matches.",
+        manual_parameters=[
+            openapi.Parameter('fuzzy', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN,
+                              description="Skip full-text search and only use typo tolerant matching"),
+        ],
         # query_serializer=SearchSerializer,
         # responses={200: openapi.Response('Response description', SearchSerializer)}
     )
@@ -431,28 +783,29 @@ class SearchAPI(GenericAPIView):
         query = kwargs.get('query', None)
         
         if query:
-            with connection.cursor() as cursor:
-                cursor.execute(f"""
-                    SELECT DISTINCT * FROM tabRecipe
-                    WHERE
-                        title LIKE '%{query}%' OR
-                        category_id LIKE '%{query}%' OR
-                        description LIKE '%{query}%' OR
-                        ingredients LIKE '%{query}%' OR
-                        cooking_time LIKE '{query}' OR
-                        serving_size LIKE '{query}'
-                """)
-                rows = cursor.fetchall()
-                if rows:
-                    columns = [col[0] for col in cursor.description]
-                    recipe = [dict(zip(columns, row)) for row in rows]
-                    response = copy.deepcopy(RESPONSE_SUCCESS)
-                    response['data']['search_results'] = recipe
-                    return Response(response, status=status.HTTP_200_OK)
-                else:
-                    response = copy.deepcopy(RESPONSE_FAILED)
-                    response['message'] = "No results found"
-                    return Response(response, status=status.HTTP_404_NOT_FOUND)
+            fuzzy = request.query_params.get('fuzzy') in ('1', 'true')
+            paginator = CustomPagination()
+            page = None
+            if not fuzzy:
+                page = paginator.paginate_queryset(search_recipes(query), request, view=self)
+                # Nothing matched exactly (e.g. a misspelling), fall back to fuzzy matching
+                fuzzy = not page and paginator.page.number == 1
+            if fuzzy:
+                page = paginator.paginate_queryset(fuzzy_search_recipes(query), request, view=self)
+            if page:
+                response = copy.deepcopy(RESPONSE_SUCCESS)
+                response['data'] = {
+                    'count': paginator.page.paginator.count,
+                    'next': paginator.get_next_link(),
+                    'previous': paginator.get_previous_link(),
+                    'fuzzy': fuzzy,
+                    'search_results': page,
+                }
+                return Response(response, status=status.HTTP_200_OK)
+            else:
+                response = copy.deepcopy(RESPONSE_FAILED)
+                response['message'] = "No results found"
+                return Response(response, status=status.HTTP_404_NOT_FOUND)
         else:
             response = copy.deepcopy(RESPONSE_FAILED)
             response['message'] = "Please enter a search query"
@@ -460,6 +813,34 @@ class SearchAPI(GenericAPIView):
 
 
 
+class AutocompleteAPI(GenericAPIView):
+    permission_classes = [IsAuthenticated]
+    max_limit = 50
+
+    @swagger_auto_schema(
+        tags=['Search & Filter'],
+        operation_description="Completions of a recipe title, category or ingredient prefix, most reviewed first",
+        manual_parameters=[
+            openapi.Parameter('q', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True),
+            openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, default=10),
+        ],
+    )
+    def get(self, request, *args, **kwargs):
+        prefix = request.query_params.get('q', '').strip()
+        if not prefix:
+            response = copy.deepcopy(RESPONSE_FAILED)
+            response['message'] = "Please enter a search prefix"
+            return Response(response, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), self.max_limit)
+        except ValueError:
+            limit = 10
+
+        completions = prefix_index.complete(prefix, limit)
+        return success_response({'completions': completions}, status=status.HTTP_200_OK, message='Completions')
+
+
+
 # class RecipeFilterAPI(GenericAPIView):
     
 #     serializer_class = RecipeFilterSerializer